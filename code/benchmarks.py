@@ -0,0 +1,436 @@
+"""Micro-benchmarks for the slow steps of the pipeline
+
+Run from the `code` folder, e.g. `python benchmarks.py hrefs`
+"""
+
+import os
+import re
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import merging_funcs as mrg
+import schema
+import storage
+import utils as ut
+import http_cache as hc
+
+PATH_BENCH = "../data/bench"
+URL_PIO = "https://www.pio.gov.cy/coronavirus/categories/press#30"
+
+
+def best_time(func, repeat=5):
+    """Best wall-clock time (s) out of `repeat` calls of func()"""
+    times = []
+    for _ in range(repeat):
+        t_start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t_start)
+    return min(times)
+
+
+def peak_memory(func):
+    """Peak memory (bytes) allocated during func() (as traced by tracemalloc)"""
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def saved_pio_page(path_html=os.path.join(PATH_BENCH, "pio_press.html")):
+    """Saved copy of the PIO press page (downloaded once if not there)"""
+    if not os.path.isfile(path_html):
+        print(f"Saving copy of PIO page in {path_html}...")
+        os.makedirs(os.path.dirname(path_html), exist_ok=True)
+        html, _ = hc.fetch_text(URL_PIO)
+        with open(path_html, "w", encoding="utf-8") as f:
+            f.write(html)
+    with open(path_html, "r", encoding="utf-8") as f:
+        return f.read()
+
+
+def bench_hrefs(repeat=10):
+    """BeautifulSoup tree vs streaming href extraction on the PIO page"""
+    from bs4 import BeautifulSoup
+
+    html = saved_pio_page()
+
+    def with_bs4():
+        soup = BeautifulSoup(html, features="html.parser")
+        return [a.get("href") for a in soup.find_all("a") if a.get("href")]
+
+    t_bs4 = best_time(with_bs4, repeat)
+    t_stdlib = best_time(lambda: ut.extract_hrefs(html, use_lxml=False), repeat)
+    print(f"Page: {len(html) / 1e3:.0f} kB, {len(with_bs4())} links")
+    print(f"BeautifulSoup (html.parser) : {t_bs4 * 1e3:8.1f} ms")
+    print(
+        f"HTMLParser events           : {t_stdlib * 1e3:8.1f} ms ({t_bs4 / t_stdlib:.1f}x)"
+    )
+    if ut.lxml_etree is not None:
+        t_lxml = best_time(lambda: ut.extract_hrefs(html), repeat)
+        print(
+            f"lxml parser target          : {t_lxml * 1e3:8.1f} ms ({t_bs4 / t_lxml:.1f}x)"
+        )
+
+
+def synthetic_links(n_links=100_000, frac_reports=0.1, seed=0):
+    """Mix of report urls from the url catalog and other (non-matching) links"""
+    import random
+    import pandas as pd
+
+    rng = random.Random(seed)
+    report_urls = pd.read_csv("../data/database_url_reports.csv")["url"].tolist()
+    links = []
+    for i in range(n_links):
+        if rng.random() < frac_reports:
+            links.append(rng.choice(report_urls))
+        else:
+            links.append(
+                f"https://www.pio.gov.cy/coronavirus/uploads/{i:06d}--Ανακοίνωση Τύπου για τα μέτρα {i}.pdf"
+            )
+    return links
+
+
+def bench_link_matcher(n_links=100_000, repeat=3):
+    """any(substring in link) loop vs one compiled LinkMatcher on synthetic links"""
+    links = synthetic_links(n_links)
+    patterns = ut.REPORT_LINK_MATCHER.include
+
+    def with_any():
+        return [
+            link for link in links if any(substring in link for substring in patterns)
+        ]
+
+    assert with_any() == ut.isolate_relevant_files(links)
+    t_any = best_time(with_any, repeat)
+    t_matcher = best_time(lambda: ut.isolate_relevant_files(links), repeat)
+    print(f"{n_links} links, {len(patterns)} patterns, {len(with_any())} matches")
+    print(f"any(substring in link) : {t_any * 1e3:8.1f} ms")
+    print(
+        f"LinkMatcher            : {t_matcher * 1e3:8.1f} ms ({t_any / t_matcher:.1f}x)"
+    )
+
+
+def bench_dates(n_copies=20, repeat=3):
+    """extract_datetime per link vs extract_datetimes on the url catalog
+
+    Also checks that both give the same dates for every link in the catalog.
+    """
+    import pandas as pd
+
+    links = pd.read_csv("../data/database_url_reports.csv")["url"]
+    expected = pd.Series([ut.extract_datetime(link) for link in links])
+    assert (ut.extract_datetimes(links) == expected.astype("datetime64[ns]")).all()
+    print(f"Same dates for all {len(links)} links in url catalog")
+
+    # unique links (query string differs), so the memo doesn't help
+    many_links = pd.concat(
+        [links + f"?copy={i}" for i in range(n_copies)], ignore_index=True
+    )
+
+    def batch_cold():
+        ut._datetime_of_link.clear()
+        return ut.extract_datetimes(many_links)
+
+    t_loop = best_time(lambda: [ut.extract_datetime(l) for l in many_links], repeat)
+    t_batch = best_time(batch_cold, repeat)
+    t_memo = best_time(lambda: ut.extract_datetimes(many_links), repeat)
+    print(f"{len(many_links)} links")
+    print(f"extract_datetime loop       : {t_loop * 1e3:8.1f} ms")
+    print(
+        f"extract_datetimes (new)     : {t_batch * 1e3:8.1f} ms ({t_loop / t_batch:.1f}x)"
+    )
+    print(
+        f"extract_datetimes (memo)    : {t_memo * 1e3:8.1f} ms ({t_loop / t_memo:.1f}x)"
+    )
+
+
+def bench_early_stop(path_reports="../data/reports"):
+    """Per-report time of parsing all pages vs stopping once all fields are found"""
+    import glob
+    import extraction as ex
+
+    paths = sorted(glob.glob(path_reports + "/*.pdf"))
+    t_full, t_early, n_differ = 0.0, 0.0, 0
+    for path in paths:
+        t_start = time.perf_counter()
+        text_full = ut.pdf_to_text(path)
+        t_full += time.perf_counter() - t_start
+
+        t_start = time.perf_counter()
+        text_early = ut.pdf_to_text(
+            path,
+            maxpages=ut.REPORT_MAXPAGES,
+            stop_when_complete=ut.report_complete_check(path),
+        )
+        t_early += time.perf_counter() - t_start
+
+        try:
+            extract = ex.template_for(ut.report_date(path)).extract
+            info_full = extract(ut.normalize_report_text(text_full))
+            info_early = extract(ut.normalize_report_text(text_early))
+        except Exception:
+            continue
+        if info_full != info_early:
+            n_differ += 1
+            print(f"Different info for {path}: {info_full} vs {info_early}")
+
+    n = max(len(paths), 1)
+    print(f"{len(paths)} reports, {n_differ} with different extracted info")
+    print(f"All pages     : {t_full / n * 1e3:8.1f} ms/report")
+    print(
+        f"Early stop    : {t_early / n * 1e3:8.1f} ms/report "
+        f"({100 * (1 - t_early / max(t_full, 1e-9)):.0f}% saved)"
+    )
+
+
+def extract_info_text_old(text):
+    """utils.extract_info_text before the templates (patterns compiled on every call),
+    kept as the baseline of bench_fields"""
+    from extraction import map_numbers
+
+    m1 = re.search(r"Ποσοστό (\s*.+?)%", text)  # "\s*" ignores white space
+    perc_unv = m1.group(1) if m1 else None
+    if not m1.group(1).strip().isnumeric():
+        m1a = re.search("στορικό εμβολιασμού(.+?)%", text)
+        perc_str = re.findall(r"[-+]?(?:\d*\.\d+|\d+)", m1a.group(1).replace(",", "."))
+        perc_unv = perc_str[0]
+
+    m2 = re.search("σήμερα, (.+?):", text)
+    date_pdf = m2.group(1) if m2 else None
+
+    m3 = re.search(r"(\w+?) ασθενείς COVID-19 νοσηλεύονται", text)
+    hosp_num = m3.group(1) if m3 else None
+
+    m4 = re.search(r"test\.(.+?) ποσοστό", text)
+    m4a = re.search(r"Εντοπίστηκαν(\s*.+?\s*)νέα", text)
+    case_num = m4.group(1) if m4 else m4a.group(1) if m4a else None
+    if case_num is not None:
+        case_num = "".join(e for e in case_num if e.isalnum())  # keep only numbers
+
+    m5 = re.search("- (.+?) άτομ", text)
+    m5a = re.search("νακοινώθηκαν (.*) θάνατ", text)
+    m5b = re.search("νακοινώθηκε (.*) θάνατ", text)
+    m5c = re.search("- (.+?) θάνατ", text)
+    death_num = (
+        m5.group(1)
+        if m5
+        else (
+            m5a.group(1)
+            if m5a
+            else m5b.group(1) if m5b else m5c.group(1) if m5c else "0"
+        )
+    )
+
+    if any(
+        substring in death_num
+        for substring in ["Δεν  καταγράφηκαν", "Δεν ανακοινώθηκαν"]
+    ):
+        death_num = "0"
+
+    if death_num != "0":
+        if not death_num.strip().isnumeric():
+            numbers_list = [
+                number if number in death_num else None for number in map_numbers.keys()
+            ]  # None except on matching number
+            word_key = list(filter(None, numbers_list))[0]
+            death_num = map_numbers[word_key]
+
+    return [perc_unv, date_pdf, hosp_num, case_num, death_num]
+
+
+def bench_fields(path_reports="../data/reports", repeat=20):
+    """extract_info_text (old, see extract_info_text_old) vs precompiled
+    extraction.extract_fields on report texts"""
+    import glob
+    import extraction as ex
+
+    texts = [
+        ut.report_text(path) for path in sorted(glob.glob(path_reports + "/*.pdf"))
+    ]
+
+    # Same numbers from both (where the old function doesn't fail)
+    n_compared = 0
+    for text in texts:
+        try:
+            old = extract_info_text_old(text)
+        except Exception:
+            continue
+        new = ex.extract_fields(text)
+        assert float(old[0].replace(",", ".")) == new.perc_hosp_unvaccinated
+        assert old[1] == new.date_pdf
+        assert float(old[2]) == new.hospitalizations
+        assert float(old[3].replace(",", "")) == new.cases
+        assert float(old[4]) == new.deaths
+        n_compared += 1
+    print(f"{len(texts)} reports, same numbers for all {n_compared} comparable ones")
+
+    def run_old():
+        for text in texts:
+            try:
+                extract_info_text_old(text)
+            except Exception:
+                pass
+
+    def run_new():
+        for text in texts:
+            ex.extract_fields(text)
+
+    n = max(len(texts), 1)
+    t_old = best_time(run_old, repeat)
+    t_new = best_time(run_new, repeat)
+    print(f"extract_info_text : {t_old / n * 1e6:8.1f} us/report")
+    print(
+        f"extract_fields    : {t_new / n * 1e6:8.1f} us/report ({t_old / t_new:.1f}x)"
+    )
+
+
+def bench_load(n_columns=4, repeat=5):
+    """read_csv(..., index_col=[0]) vs loaders w compact dtypes (all / first n columns)
+
+    Load time, peak memory while loading & memory of the loaded frame
+    """
+
+    def with_read_csv(name):
+        df = pd.read_csv(storage.path_csv(name), index_col=[0])
+        for column in schema.date_columns(name):
+            df[column] = pd.to_datetime(df[column], format="%Y-%m-%d")
+        return df
+
+    for name in schema.SCHEMAS:
+        if not os.path.isfile(storage.path_csv(name)):
+            print(f"{name}: no csv, skipped")
+            continue
+        columns = list(schema.SCHEMAS[name])[:n_columns]
+        loaders = {
+            "read_csv": lambda: with_read_csv(name),
+            "load(compact=True)": lambda: storage.load(name, compact=True),
+            f"load({n_columns} columns)": lambda: storage.load(
+                name, columns=columns, compact=True
+            ),
+        }
+        print(f"{name}:")
+        t_ref = best_time(loaders["read_csv"], repeat)
+        for label, load in loaders.items():
+            t_load = best_time(load, repeat)
+            print(
+                f"  {label:20}: {t_load * 1e3:7.1f} ms ({t_ref / t_load:4.1f}x), "
+                f"peak {peak_memory(load) / 1e6:6.2f} MB, "
+                f"frame {load().memory_usage(deep=True).sum() / 1e6:6.2f} MB"
+            )
+
+
+def synthetic_daily_series(years=60, report_years=20, lag_days=10, seed=0):
+    """Daily group data over `years` & daily report data over the last `report_years`,
+    extending `lag_days` after the group data (like data.gov.cy lagging the reports)"""
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("1960-01-01", periods=int(years * 365.25), freq="D")
+    df_grp = pd.DataFrame(
+        {
+            "date": dates,
+            "daily new cases": rng.integers(0, 5000, len(dates)),
+            "daily deaths": rng.integers(0, 10, len(dates)).astype(float),
+            "Hospitalised Cases": rng.integers(0, 300, len(dates)).astype(float),
+            "Cases In ICUs": rng.integers(0, 50, len(dates)).astype(float),
+            "Incubated Cases": rng.integers(0, 20, len(dates)).astype(float),
+        }
+    )
+    dates_ind = pd.date_range(
+        dates[-1] - pd.Timedelta(days=int(report_years * 365.25)),
+        dates[-1] + pd.Timedelta(days=lag_days),
+        freq="D",
+    )
+    perc = rng.uniform(40, 95, len(dates_ind)).round(2)
+    df_ind = pd.DataFrame(
+        {
+            "date": dates_ind,
+            "hospitalizations_dailyrep": rng.integers(0, 300, len(dates_ind)) * 1.0,
+            "perc_hosp_unvaccinated": perc,
+            "daily new cases": rng.integers(0, 5000, len(dates_ind)) * 1.0,
+            "daily deaths": rng.integers(0, 10, len(dates_ind)) * 1.0,
+            "perc_hosp_vaccinated": 100 - perc,
+        }
+    )
+    return df_grp, df_ind
+
+
+def bench_date_index(years=60, repeat=5):
+    """query() strings & merge vs the reconcile merge (sources aligned on dates), on a
+    synthetic multi-decade daily series (merge & plot steps)"""
+    df_grp, df_ind = synthetic_daily_series(years)
+    print(f"{len(df_grp)} days of group data, {len(df_ind)} days of reports")
+
+    def merge_with_query():
+        last_date_group = df_grp["date"].iloc[-1].date()
+        df_extra = df_ind[
+            ["date", "daily new cases", "daily deaths", "hospitalizations_dailyrep"]
+        ].query("date > @last_date_group")
+        df_extra = df_extra.rename(
+            columns={"hospitalizations_dailyrep": "Hospitalised Cases"}
+        )
+        for col in df_grp.columns:
+            if col not in df_extra.columns:
+                df_extra[col] = np.nan
+        df_ex1 = pd.concat([df_grp, df_extra], axis=0)
+        df_vacc_info = df_ind[
+            ["date", "perc_hosp_unvaccinated", "perc_hosp_vaccinated"]
+            + ["hospitalizations_dailyrep"]
+        ].rename(columns={"hospitalizations_dailyrep": "Hospitalizations from reports"})
+        return df_ex1.merge(df_vacc_info, on="date", how="left")
+
+    def merge_with_index():
+        df_extent, _ = mrg.extended_dataset(df_grp, df_ind)
+        return df_extent
+
+    # the merge prints a line per call
+    sys.stdout = open(os.devnull, "w")
+    try:
+        same = merge_with_query().equals(
+            merge_with_index().iloc[:, :-2].astype(merge_with_query().dtypes)
+        )
+        t_query = best_time(merge_with_query, repeat)
+        t_index = best_time(merge_with_index, repeat)
+    finally:
+        sys.stdout.close()
+        sys.stdout = sys.__stdout__
+    print(f"Merge (identical results: {same})")
+    print(f"  query() + merge      : {t_query * 1e3:8.1f} ms")
+    print(
+        f"  reconcile (aligned)  : {t_index * 1e3:8.1f} ms ({t_query / t_index:.1f}x)"
+    )
+
+    # Plot step: select the days since a date
+    df = merge_with_query()
+    since = str(df["date"].iloc[len(df) // 2].date())
+    t_query = best_time(lambda: df.query(f"date >= '{since}'"), repeat * 4)
+    t_slice = best_time(
+        lambda: df.iloc[df["date"].searchsorted(pd.Timestamp(since)) :], repeat * 4
+    )
+    print("Plots, rows since a date")
+    print(f"  query()              : {t_query * 1e3:8.2f} ms")
+    print(
+        f"  searchsorted slice   : {t_slice * 1e3:8.2f} ms ({t_query / t_slice:.1f}x)"
+    )
+
+
+BENCHMARKS = {
+    "hrefs": bench_hrefs,
+    "link_matcher": bench_link_matcher,
+    "dates": bench_dates,
+    "early_stop": bench_early_stop,
+    "fields": bench_fields,
+    "load": bench_load,
+    "date_index": bench_date_index,
+}
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"--- {name} ---")
+        BENCHMARKS[name]()
@@ -0,0 +1,48 @@
+"""Manual corrections of the merged daily stats, kept as an overlay table
+
+data/corrections.csv has one row per corrected cell: date, column, value, the
+version of the overlay that added/changed it & a note w the reason (for audits).
+The overlay is a source of the extended dataset w the highest priority, see
+corrections_frame & reconcile.py.
+"""
+
+import hashlib
+import os
+
+import pandas as pd
+
+PATH_CORRECTIONS = "../data/corrections.csv"
+
+_loaded = {}  # path -> (mtime of the file when loaded, overlay)
+
+
+def load_corrections(path_corrections=PATH_CORRECTIONS):
+    """The overlay table, read again only when the file changed (mtime)"""
+    mtime = os.path.getmtime(path_corrections)
+    if path_corrections in _loaded and _loaded[path_corrections][0] == mtime:
+        return _loaded[path_corrections][1]
+    overlay = pd.read_csv(path_corrections)
+    overlay["date"] = pd.to_datetime(overlay["date"], format="%Y-%m-%d")
+    if overlay.duplicated(["date", "column"]).any():
+        raise ValueError(
+            f"More than one correction for a (date, column) in {path_corrections}"
+        )
+    _loaded[path_corrections] = (mtime, overlay)
+    return overlay
+
+
+def overlay_fingerprint(path_corrections=PATH_CORRECTIONS):
+    """sha256 of the overlay table (merges are recomputed when it changes)"""
+    with open(path_corrections, "rb") as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+def corrections_frame(version=None, overlay=None):
+    """The overlay as a frame w a "date" column & a column per corrected column
+    (NaN where a date has no correction for it), to be used as a source in reconcile"""
+    if overlay is None:
+        overlay = load_corrections()
+    if version is not None:
+        overlay = overlay[overlay["version"] <= version]
+    wide = overlay.pivot(index="date", columns="column", values="value")
+    return wide.rename_axis(columns=None).reset_index()
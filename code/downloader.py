@@ -0,0 +1,138 @@
+import hashlib
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+MAX_IN_FLIGHT = 8  # max number of requests running at the same time
+RETRIES = 3
+BACKOFF_FACTOR = 0.5  # sleeps 0.5s, 1s, 2s, ... between retries
+TIMEOUT = 30  # seconds
+RETRY_STATUS = [429, 500, 502, 503, 504]
+CHUNK_SIZE = 64 * 1024
+
+
+def make_session(pool_size=MAX_IN_FLIGHT, retries=RETRIES, backoff=BACKOFF_FACTOR):
+    """Session that keeps connections alive and retries failed requests w backoff"""
+    retry = Retry(
+        total=retries,
+        backoff_factor=backoff,
+        status_forcelist=RETRY_STATUS,
+        allowed_methods=["GET", "HEAD"],
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(
+        pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry
+    )
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+
+    return session
+
+
+def temp_path_for(path):
+    """Hidden temp file next to the target, so a partial download never looks like a report"""
+    folder, filename = os.path.split(path)
+    return os.path.join(folder, "." + filename + ".part")
+
+
+def stream_to_file(response, path, chunk_size=CHUNK_SIZE):
+    """Stream response body to temp file, fsync, check length, then atomically rename to path
+
+    Returns (sha256 hex digest, number of bytes). Raises IOError on truncated bodies.
+    """
+    tmp_path = temp_path_for(path)
+    sha256 = hashlib.sha256()
+    n_bytes = 0
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                f.write(chunk)
+                sha256.update(chunk)
+                n_bytes += len(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+
+        # Content-Length refers to the encoded body, only compare if not compressed
+        expected = response.headers.get("Content-Length")
+        if expected is not None and "Content-Encoding" not in response.headers:
+            if int(expected) != n_bytes:
+                raise IOError(f"Truncated download: got {n_bytes} of {expected} bytes")
+
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return sha256.hexdigest(), n_bytes
+
+
+def download_file(session, url, path, timeout=TIMEOUT):
+    """Download a single file, returns dict with the outcome & timing"""
+    t_start = time.perf_counter()
+    result = {
+        "url": url,
+        "path": path,
+        "ok": False,
+        "status": None,
+        "error": None,
+        "sha256": None,
+        "size": None,
+    }
+    try:
+        with session.get(url, timeout=timeout, stream=True) as response:
+            result["status"] = response.status_code
+            if response.ok:
+                result["sha256"], result["size"] = stream_to_file(response, path)
+                result["ok"] = True
+    except (requests.RequestException, IOError) as e:
+        result["error"] = str(e)
+    result["seconds"] = time.perf_counter() - t_start
+
+    return result
+
+
+def download_many(jobs, max_in_flight=MAX_IN_FLIGHT, session=None):
+    """Download files concurrently
+
+    :param jobs: list of (url, path) tuples
+    :param max_in_flight: max number of requests running at the same time
+    :param session: requests.Session to reuse (one with a connection pool is created if None)
+    :return: list of result dicts (see download_file), in the order of jobs
+    """
+    if not jobs:
+        return []
+
+    own_session = session is None
+    if own_session:
+        session = make_session(pool_size=max_in_flight)
+
+    results = [None] * len(jobs)
+    t_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        futures = {
+            executor.submit(download_file, session, url, path): i
+            for i, (url, path) in enumerate(jobs)
+        }
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            status = (
+                "ok"
+                if result["ok"]
+                else f"FAILED ({result['status'] or result['error']})"
+            )
+            print(f"{result['path']}: {status} in {result['seconds']:.2f}s")
+
+    n_ok = sum(r["ok"] for r in results)
+    print(
+        f"Downloaded {n_ok}/{len(jobs)} files in {time.perf_counter() - t_start:.2f}s"
+    )
+    if own_session:
+        session.close()
+
+    return results
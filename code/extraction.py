@@ -0,0 +1,259 @@
+"""Extraction of covid numbers from the (normalized) text of PIO daily reports
+
+All patterns are compiled once, at import. Fallback patterns (older wordings of the
+announcement) are only tried when the preferred ones don't match.
+
+Each report is extracted by the template registered for its date (see register_template).
+To parse older reports, register a template for their dates: download_reports and
+get_info_from_reports then pick up all reports from its first date on.
+"""
+
+import bisect
+import re
+from collections import namedtuple
+from typing import NamedTuple, Optional
+
+map_numbers = {
+    "Ένα": "1",
+    "Δύο": "2",
+    "Τρία": "3",
+    "Τέσσερα": "4",
+    "Πέντε": "5",
+    "Έξι": "6",
+    "Επτά": "7",
+    "Εφτά": "7",
+    "Οχτώ": "8",
+    "Εννιά": "9",
+    "Δέκα": "10",
+    "Έντεκα": "11",
+    "Δώδεκα": "12",
+    "Δεκατρία": "13",
+}
+# Position of each number word in map_numbers, when more than one is found the first is used
+_number_word_order = {word: i for i, word in enumerate(map_numbers)}
+RE_NUMBER_WORD = re.compile("|".join(map(re.escape, map_numbers)))
+
+RE_PERC_UNV = re.compile(r"Ποσοστό (\s*.+?)%")  # "\s*" ignores white space
+RE_PERC_UNV_HISTORY = re.compile(r"στορικό εμβολιασμού(.+?)%")
+RE_DECIMAL = re.compile(r"[-+]?(?:\d*\.\d+|\d+)")
+RE_DATE_PDF = re.compile(r"σήμερα, (.+?):")
+RE_HOSP = re.compile(r"(\w+?) ασθενείς COVID-19 νοσηλεύονται")
+RE_CASES = (
+    re.compile(r"test\.(.+?) ποσοστό"),
+    re.compile(r"Εντοπίστηκαν(\s*.+?\s*)νέα"),
+)
+RE_DEATHS = (
+    re.compile(r"- (.+?) άτομ"),
+    re.compile(r"νακοινώθηκαν (.*) θάνατ"),
+    re.compile(r"νακοινώθηκε (.*) θάνατ"),
+    re.compile(r"- (.+?) θάνατ"),
+)
+NO_DEATHS = ("Δεν  καταγράφηκαν", "Δεν ανακοινώθηκαν")
+
+
+class ReportInfo(NamedTuple):
+    """Numbers extracted from a daily report (None -> not found)"""
+
+    perc_hosp_unvaccinated: Optional[float]
+    date_pdf: Optional[str]
+    hospitalizations: Optional[float]
+    cases: Optional[float]
+    deaths: Optional[float]
+
+    def missing_fields(self):
+        """Required fields (all but date_pdf) that were not found"""
+        return [
+            field
+            for field, value in self._asdict().items()
+            if value is None and field != "date_pdf"
+        ]
+
+
+def first_group(patterns, text):
+    """group(1) of the first pattern that matches text, None if none does"""
+    for pattern in patterns:
+        m = pattern.search(text)
+        if m:
+            return m.group(1)
+    return None
+
+
+def greek_number(words):
+    """'Δύο άτομα' -> '2' (the first number word in map_numbers order wins)"""
+    found = RE_NUMBER_WORD.findall(words)
+    if not found:
+        raise ValueError(f"No number in '{words}'")
+    return map_numbers[min(found, key=_number_word_order.get)]
+
+
+def to_float(number_str):
+    return None if number_str is None else float(number_str)
+
+
+def extract_perc_unvaccinated(text):
+    m = RE_PERC_UNV.search(text)
+    if m and m.group(1).strip().isnumeric():
+        return m.group(1)
+    m = RE_PERC_UNV_HISTORY.search(text)
+    if m is None:
+        return None
+    return RE_DECIMAL.findall(m.group(1).replace(",", "."))[0]
+
+
+def extract_cases(text):
+    case_num = first_group(RE_CASES, text)
+    if case_num is None:
+        return None
+    return "".join(e for e in case_num if e.isalnum())  # keep only numbers
+
+
+def extract_deaths(text):
+    death_num = first_group(RE_DEATHS, text)
+    if death_num is None or any(s in death_num for s in NO_DEATHS):
+        return "0"
+    if not death_num.strip().isnumeric():
+        return greek_number(death_num)
+    return death_num
+
+
+def preferred_counts_found(text):
+    """Whether hospitalizations, cases & deaths are found by their preferred pattern
+    (the first one tried)
+
+    A field found only by a fallback could still be found by its preferred pattern
+    further on (& the greedy death fallbacks grow w the text), so the counts can't
+    change anymore only once all preferred patterns match.
+    """
+    return all(
+        patterns[0].search(text) for patterns in ((RE_HOSP,), RE_CASES, RE_DEATHS)
+    )
+
+
+def perc_unvaccinated_final(text):
+    """Whether the unvaccinated % extracted from text can't change w more text:
+    RE_PERC_UNV matched & its number is used, or RE_PERC_UNV_HISTORY matched too"""
+    m = RE_PERC_UNV.search(text)
+    if m is None:
+        return False
+    return m.group(1).strip().isnumeric() or bool(RE_PERC_UNV_HISTORY.search(text))
+
+
+def all_fields_final(text):
+    """preferred_counts_found + perc_unvaccinated_final"""
+    return perc_unvaccinated_final(text) and preferred_counts_found(text)
+
+
+def extract_counts(text):
+    """ReportInfo w/o the unvaccinated % from the normalized text of a report
+
+    Raises ValueError if a number found in the text can't be read.
+    """
+    cases = extract_cases(text)
+
+    return ReportInfo(
+        perc_hosp_unvaccinated=None,
+        date_pdf=first_group((RE_DATE_PDF,), text),
+        hospitalizations=to_float(first_group((RE_HOSP,), text)),
+        cases=to_float(None if cases is None else cases.replace(",", "")),
+        deaths=to_float(extract_deaths(text)),
+    )
+
+
+def extract_fields(text):
+    """ReportInfo from the normalized text of a report
+
+    Raises ValueError if a number found in the text can't be read.
+    """
+    perc_unv = extract_perc_unvaccinated(text)
+    return extract_counts(text)._replace(
+        perc_hosp_unvaccinated=to_float(
+            None if perc_unv is None else perc_unv.replace(",", ".")
+        )
+    )
+
+
+# Registry of report templates. The wording of the announcements changed over time,
+# each template extracts the reports of a date range (dates as "YYYY-MM-DD", inclusive).
+# Bump the version of a template when its extraction changes, its complete_version
+# when its complete function changes (the texts cached w the old one are then stale).
+Template = namedtuple(
+    "Template",
+    [
+        "name",
+        "version",
+        "first_date",
+        "last_date",
+        "required",
+        "extract",
+        "complete",
+        "complete_version",
+    ],
+)
+TEMPLATES = []
+
+
+def register_template(
+    name,
+    first_date,
+    last_date="9999-12-31",
+    version=1,
+    required=None,
+    complete=None,
+    complete_version=1,
+):
+    """Decorator registering a function text -> ReportInfo for reports in a date range
+
+    :param required: fields that must be found for a report to count as parsed
+        (default: all fields but date_pdf)
+    :param complete: function text -> True once more pages can't change what is
+        extracted, the rest of the pdf is then not parsed (None -> parse all pages)
+    :param complete_version: version of complete, part of the key of the cached texts
+    """
+    if required is None:
+        required = [field for field in ReportInfo._fields if field != "date_pdf"]
+
+    def decorator(extract):
+        for template in TEMPLATES:
+            if first_date <= template.last_date and template.first_date <= last_date:
+                raise ValueError(f"Template {name} overlaps with {template.name}")
+        TEMPLATES.append(
+            Template(
+                name,
+                version,
+                first_date,
+                last_date,
+                tuple(required),
+                extract,
+                complete,
+                complete_version,
+            )
+        )
+        TEMPLATES.sort(key=lambda template: template.first_date)
+        return extract
+
+    return decorator
+
+
+def template_for(date):
+    """Template covering the report of date ("YYYY-MM-DD"), None if there is none"""
+    i = bisect.bisect_right([template.first_date for template in TEMPLATES], date) - 1
+    if i >= 0 and date <= TEMPLATES[i].last_date:
+        return TEMPLATES[i]
+    return None
+
+
+def first_report_date():
+    """Earliest date for which reports can be parsed"""
+    return TEMPLATES[0].first_date
+
+
+# From 16.07.2021 the reports include the percentage of unvaccinated among hospitalized
+# (the older reports of the catalog, from 16.10.2020 on, get a template once one is
+# checked against real reports of then)
+register_template(
+    "vaccination_status",
+    "2021-07-16",
+    version=2,
+    complete=all_fields_final,
+    complete_version=2,
+)(extract_fields)
@@ -0,0 +1,176 @@
+"""Throughput & accuracy of report extraction against data_from_pdf_reports.csv
+
+Usage (from the `code` folder):
+    python golden_harness.py [path to folder w pdfs or texts] [--no-cache]
+
+With pdfs the text comes from the text cache (--no-cache -> parsed again, so the pdf
+backend is timed too). Texts are <YYYY_MM_DD>.txt files, or the text cache itself
+(<sha256 of pdf>_<settings key>.txt, dated by the sha256 in the ledger). Results are
+saved as json in data/bench, to diff between runs.
+"""
+
+import glob
+import json
+import os
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+import extraction as ex
+import ledger
+import pdf_backends as pb
+import utils as ut
+
+PATH_GOLDEN = "../data/data_from_pdf_reports.csv"
+PATH_RESULTS = "../data/bench"
+
+# csv column -> field of extraction.ReportInfo
+FIELDS = {
+    "hospitalizations_dailyrep": "hospitalizations",
+    "perc_hosp_unvaccinated": "perc_hosp_unvaccinated",
+    "daily new cases": "cases",
+    "daily deaths": "deaths",
+}
+RE_DATED_TEXT = re.compile(r"(\d{4})_(\d{2})_(\d{2})\.txt")
+RE_CACHED_TEXT = re.compile(r"([0-9a-f]{64})_([0-9a-f]{12})\.txt")
+
+
+def matches_golden(value, expected):
+    """Whether an extracted value (None -> not found) agrees w its golden value"""
+    if value is None:
+        return pd.isna(expected)  # not in this template (e.g. % before 16.07.2021)
+    return bool(np.isclose(value, expected))
+
+
+def cached_text_dates(path_ledger=ledger.PATH_LEDGER):
+    """{sha256: date} of the reports in the ledger (names the texts of the text cache)"""
+    if not os.path.isfile(path_ledger):
+        return {}
+    con = ledger.connect(path_ledger)
+    try:
+        return {sha256: date for date, (sha256, _) in ledger.stored_hashes(con).items()}
+    finally:
+        con.close()
+
+
+def load_texts(path_dir, use_cache=True):
+    """Yields (date, function returning the normalized text) for each report in path_dir"""
+    dated, skipped = [], []
+    dates_by_sha256 = None
+    for path in sorted(glob.glob(os.path.join(path_dir, "*.txt"))):
+        name = os.path.basename(path)
+        m = RE_DATED_TEXT.fullmatch(name)
+        if m:
+            dated.append(("-".join(m.groups()), path))
+            continue
+        m = RE_CACHED_TEXT.fullmatch(name)
+        if m is None:
+            skipped.append(name)
+            continue
+        if dates_by_sha256 is None:
+            dates_by_sha256 = cached_text_dates()
+        date = dates_by_sha256.get(m.group(1))
+        # only the texts of the current settings (see utils.text_settings_key)
+        if date is None or m.group(2) != ut.text_settings_key(f"{date}.pdf"):
+            skipped.append(name)
+            continue
+        dated.append((date, path))
+    if skipped:
+        print(f"Skipping {len(skipped)} texts w/o date or from other settings")
+
+    for date, path in sorted(dated):
+        yield date, lambda path=path: Path(path).read_text(encoding="utf-8")
+
+    for path in sorted(glob.glob(os.path.join(path_dir, "*.pdf"))):
+        if use_cache:
+            yield ut.report_date(path), lambda path=path: ut.report_text(path)
+        else:
+            yield ut.report_date(path), lambda path=path: ut.normalize_report_text(
+                ut.pdf_to_text(
+                    path,
+                    maxpages=ut.REPORT_MAXPAGES,
+                    stop_when_complete=ut.report_complete_check(path),
+                )
+            )
+
+
+def run(path_dir="../data/reports", use_cache=True, path_golden=PATH_GOLDEN):
+    golden = pb.load_golden(path_golden)
+
+    latencies = []
+    mismatches = {column: [] for column in FIELDS}
+    failed = {}
+    n_compared = 0
+    t_start = time.perf_counter()
+    for date, get_text in load_texts(path_dir, use_cache):
+        t_report = time.perf_counter()
+        try:
+            template = ex.template_for(date)
+            if template is None:
+                raise ValueError("No report template for this date")
+            info = template.extract(get_text())
+        except Exception as e:
+            failed[date] = f"{type(e).__name__}: {e}"
+            continue
+        finally:
+            latencies.append(time.perf_counter() - t_report)
+
+        if date not in golden.index:
+            continue
+        n_compared += 1
+        for column, field in FIELDS.items():
+            value, expected = getattr(info, field), golden.loc[date, column]
+            if not matches_golden(value, expected):
+                mismatches[column].append(
+                    {"date": date, "extracted": value, "golden": float(expected)}
+                )
+    seconds = time.perf_counter() - t_start
+
+    latencies_ms = np.array(latencies) * 1e3
+    results = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "path": path_dir,
+        "text_cache": use_cache,
+        "pdf_backend": pb.selected_backend(),
+        "n_reports": len(latencies),
+        "n_compared": n_compared,
+        "reports_per_second": len(latencies) / seconds if seconds else None,
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)) if latencies else None,
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)) if latencies else None,
+        "n_mismatches": {column: len(m) for column, m in mismatches.items()},
+        "mismatches": mismatches,
+        "failed": failed,
+    }
+
+    print(f"{results['n_reports']} reports ({n_compared} w golden values)")
+    if not latencies:
+        print(f"No reports found in {path_dir}")
+        return results
+    print(
+        f"{results['reports_per_second']:.1f} reports/s, latency p50 "
+        f"{results['latency_ms_p50']:.2f} ms, p95 {results['latency_ms_p95']:.2f} ms"
+    )
+    print(f"Mismatches per field: {results['n_mismatches']}, failed: {len(failed)}")
+
+    return results
+
+
+def save_results(results, path_results=PATH_RESULTS):
+    os.makedirs(path_results, exist_ok=True)
+    stamp = results["timestamp"].replace(":", "").replace("-", "")
+    path = os.path.join(path_results, f"harness_{stamp}.json")
+    with open(path, "w") as f:
+        json.dump(results, f, indent=1, ensure_ascii=False)
+    print(f"Results saved in {path}")
+    return path
+
+
+if __name__ == "__main__":
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    results = run(*args[:1], use_cache="--no-cache" not in sys.argv)
+    save_results(results)
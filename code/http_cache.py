@@ -0,0 +1,148 @@
+import hashlib
+import json
+import os
+import time
+from collections import namedtuple
+
+import downloader as dl
+
+CACHE_DIR = "../data/http_cache"
+TTL_SECONDS = 60 * 60  # within the ttl the cached body is used w/o asking the server
+MAX_CACHE_BYTES = 200 * 1024 * 1024  # least recently used entries evicted above it
+
+# changed -> False when the server answered 304 (or the ttl was not over yet),
+#            or the new body is identical to the cached one
+CachedResponse = namedtuple("CachedResponse", ["url", "content", "changed", "status"])
+
+_session = None
+# url -> (body, index entry, cache_dir, max_bytes) fetched w commit=False, not stored yet
+_pending = {}
+
+
+def get_session():
+    """One pooled session shared by all cached fetches"""
+    global _session
+    if _session is None:
+        _session = dl.make_session()
+    return _session
+
+
+def _index_path(cache_dir):
+    return os.path.join(cache_dir, "index.json")
+
+
+def load_index(cache_dir=CACHE_DIR):
+    path = _index_path(cache_dir)
+    if not os.path.isfile(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_index(index, cache_dir=CACHE_DIR):
+    path = _index_path(cache_dir)
+    with open(path + ".tmp", "w") as f:
+        json.dump(index, f, indent=1)
+    os.replace(path + ".tmp", path)
+
+
+def _body_path(url, cache_dir):
+    return os.path.join(cache_dir, hashlib.sha1(url.encode("utf-8")).hexdigest())
+
+
+def _read_body(url, cache_dir):
+    with open(_body_path(url, cache_dir), "rb") as f:
+        return f.read()
+
+
+def evict(index, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES):
+    """Remove least recently used entries until the cache fits in max_bytes"""
+    total = sum(entry["size"] for entry in index.values())
+    for url in sorted(index, key=lambda u: index[u]["last_used"]):
+        if total <= max_bytes:
+            break
+        total -= index[url]["size"]
+        path = _body_path(url, cache_dir)
+        if os.path.isfile(path):
+            os.remove(path)
+        del index[url]
+
+
+def _store(url, content, entry, cache_dir, max_bytes):
+    index = load_index(cache_dir)
+    with open(_body_path(url, cache_dir), "wb") as f:
+        f.write(content)
+    index[url] = entry
+    evict(index, cache_dir, max_bytes)
+    save_index(index, cache_dir)
+
+
+def fetch(
+    url, ttl=TTL_SECONDS, cache_dir=CACHE_DIR, max_bytes=MAX_CACHE_BYTES, commit=True
+):
+    """GET url through the on-disk cache, using conditional requests (ETag/Last-Modified)
+
+    :param commit: False -> a new body is stored only by commit(url), e.g. once the
+        dataset made from it is saved (if that fails, the next fetch is changed again)
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    index = load_index(cache_dir)
+    entry = index.get(url)
+    now = time.time()
+    if entry is not None and not os.path.isfile(_body_path(url, cache_dir)):
+        entry = None  # body lost, fetch again
+
+    # Fresh enough -> don't even ask the server
+    if entry is not None and now - entry["fetched_at"] < ttl:
+        entry["last_used"] = now
+        save_index(index, cache_dir)
+        return CachedResponse(url, _read_body(url, cache_dir), False, 200)
+
+    headers = {}
+    if entry is not None:
+        if entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+
+    response = get_session().get(url, headers=headers, timeout=dl.TIMEOUT)
+
+    if response.status_code == 304 and entry is not None:
+        print(f"Not modified since last download: {url}")
+        entry["fetched_at"] = now
+        entry["last_used"] = now
+        save_index(index, cache_dir)
+        return CachedResponse(url, _read_body(url, cache_dir), False, 304)
+
+    response.raise_for_status()
+    content = response.content
+    sha256 = hashlib.sha256(content).hexdigest()
+    changed = entry is None or entry.get("sha256") != sha256
+
+    new_entry = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "sha256": sha256,
+        "size": len(content),
+        "fetched_at": now,
+        "last_used": now,
+    }
+    if commit:
+        _store(url, content, new_entry, cache_dir, max_bytes)
+    else:
+        _pending[url] = (content, new_entry, cache_dir, max_bytes)
+
+    return CachedResponse(url, content, changed, response.status_code)
+
+
+def commit(url):
+    """Store the body of url fetched w commit=False (no-op if there is none), in the
+    cache_dir (& w the max_bytes) given to that fetch"""
+    if url in _pending:
+        _store(url, *_pending.pop(url))
+
+
+def fetch_text(url, ttl=TTL_SECONDS, encoding="utf-8"):
+    """Same as fetch, but returns (text, changed)"""
+    response = fetch(url, ttl=ttl)
+    return response.content.decode(encoding, errors="replace"), response.changed
@@ -0,0 +1,205 @@
+"""Ledger (sqlite) with the processing state of every daily report
+
+States: discovered -> downloaded -> parsed, or download_failed / parse_failed.
+Each stage selects its work w one indexed query.
+"""
+
+import os
+import sqlite3
+from datetime import datetime
+
+import extraction as ex
+import utils as ut
+
+PATH_LEDGER = "../data/reports_ledger.sqlite"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS reports (
+    date TEXT PRIMARY KEY,  -- YYYY-MM-DD
+    url TEXT,
+    state TEXT NOT NULL,
+    sha256 TEXT,
+    size INTEGER,
+    template TEXT,  -- template (& version) that parsed the report
+    template_version INTEGER,
+    error TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS reports_state ON reports (state, date);
+CREATE TABLE IF NOT EXISTS templates (
+    name TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    first_date TEXT NOT NULL,
+    last_date TEXT NOT NULL
+);
+"""
+
+
+def connect(path_ledger=PATH_LEDGER):
+    con = sqlite3.connect(path_ledger)
+    con.executescript(SCHEMA)
+    sync_templates(con)
+    return con
+
+
+def _now():
+    return datetime.now().isoformat(timespec="seconds")
+
+
+def is_empty(con):
+    return con.execute("SELECT COUNT(*) FROM reports").fetchone()[0] == 0
+
+
+def sync_templates(con):
+    """Copy the registered templates (extraction.TEMPLATES) in the ledger"""
+    with con:
+        con.execute("DELETE FROM templates")
+        con.executemany(
+            "INSERT INTO templates VALUES (?, ?, ?, ?)",
+            [(t.name, t.version, t.first_date, t.last_date) for t in ex.TEMPLATES],
+        )
+
+
+def _insert_discovered(con, dates_urls):
+    con.executemany(
+        "INSERT OR IGNORE INTO reports (date, url, state, updated_at) "
+        "VALUES (?, ?, 'discovered', ?)",
+        [(date, url, _now()) for date, url in dates_urls],
+    )
+
+
+def _upsert_downloaded(con, dates_hashes):
+    con.executemany(
+        "INSERT INTO reports (date, state, sha256, size, updated_at) "
+        "VALUES (?, 'downloaded', ?, ?, ?) "
+        "ON CONFLICT (date) DO UPDATE SET state = 'downloaded', "
+        "sha256 = excluded.sha256, size = excluded.size, error = NULL, "
+        "template = NULL, template_version = NULL, updated_at = excluded.updated_at",
+        [(date, sha256, size, _now()) for date, sha256, size in dates_hashes],
+    )
+
+
+def _update_parsed(con, dates):
+    con.executemany(
+        "UPDATE reports SET state = 'parsed', template = ?, template_version = ?, "
+        "error = NULL, updated_at = ? WHERE date = ?",
+        [_template_row(date) + (_now(), date) for date in dates],
+    )
+
+
+def record_discovered(con, dates_urls):
+    """Add new reports [(date, url)], reports already in the ledger keep their state"""
+    with con:
+        _insert_discovered(con, dates_urls)
+
+
+def record_downloaded(con, dates_hashes):
+    """[(date, sha256, size)] of reports downloaded (or found on disk)"""
+    with con:
+        _upsert_downloaded(con, dates_hashes)
+
+
+def record_parsed(con, dates):
+    """Reports parsed successfully (by the template registered for their date)"""
+    with con:
+        _update_parsed(con, dates)
+
+
+def record_failed(con, dates_errors, stage):
+    """{date: error} of reports that failed to download/parse (stage: 'download'/'parse')"""
+    with con:
+        if stage == "parse":
+            con.executemany(
+                "UPDATE reports SET state = 'parse_failed', template = ?, "
+                "template_version = ?, error = ?, updated_at = ? WHERE date = ?",
+                [
+                    _template_row(date) + (error, _now(), date)
+                    for date, error in dates_errors.items()
+                ],
+            )
+        else:
+            con.executemany(
+                "UPDATE reports SET state = 'download_failed', error = ?, updated_at = ? "
+                "WHERE date = ?",
+                [(error, _now(), date) for date, error in dates_errors.items()],
+            )
+
+
+def record_missing(con, dates):
+    """Reports whose pdf is gone/corrupt -> download again"""
+    with con:
+        con.executemany(
+            "UPDATE reports SET state = 'discovered', sha256 = NULL, size = NULL, "
+            "updated_at = ? WHERE date = ?",
+            [(_now(), date) for date in dates],
+        )
+
+
+def _template_row(date):
+    template = ex.template_for(date)
+    return (template.name, template.version) if template else (None, None)
+
+
+def to_download(con):
+    """Dates of reports to download (only those a template can parse)"""
+    rows = con.execute(
+        "SELECT date FROM reports "
+        "WHERE state IN ('discovered', 'download_failed') AND date >= ? ORDER BY date",
+        (ex.first_report_date(),),
+    )
+    return [date for (date,) in rows]
+
+
+def to_parse(con):
+    """Dates of downloaded reports never parsed, or parsed by another template version"""
+    rows = con.execute(
+        "SELECT r.date FROM reports r "
+        "JOIN templates t ON r.date BETWEEN t.first_date AND t.last_date "
+        "WHERE r.state = 'downloaded' "
+        "OR (r.state IN ('parsed', 'parse_failed') "
+        "    AND (r.template IS NOT t.name OR r.template_version IS NOT t.version)) "
+        "ORDER BY r.date"
+    )
+    return [date for (date,) in rows]
+
+
+def reset_parsed(con):
+    """Mark all parsed reports as only downloaded, so they are all parsed again"""
+    with con:
+        con.execute(
+            "UPDATE reports SET state = 'downloaded', template = NULL, "
+            "template_version = NULL, updated_at = ? "
+            "WHERE state IN ('parsed', 'parse_failed')",
+            (_now(),),
+        )
+
+
+def stored_hashes(con):
+    """{date: (sha256, size)} of downloaded reports"""
+    rows = con.execute(
+        "SELECT date, sha256, size FROM reports WHERE sha256 IS NOT NULL"
+    )
+    return {date: (sha256, size) for date, sha256, size in rows}
+
+
+def bootstrap(con, df_url, path_reports, parsed_dates):
+    """Fill an empty ledger from the url catalog, the pdfs on disk & the parsed dates
+
+    All in one transaction: if anything fails the ledger stays empty (& is filled on
+    the next run). A missing path_reports counts as no pdfs on disk.
+    """
+    print("Creating reports ledger from existing files...")
+    filenames = sorted(os.listdir(path_reports)) if os.path.isdir(path_reports) else []
+    downloaded = []
+    for filename in filenames:
+        path = os.path.join(path_reports, filename)
+        # pdfs w/o trailer are left out, they are downloaded again
+        if filename.endswith(".pdf") and ut.has_pdf_trailer(path):
+            downloaded.append(
+                (ut.report_date(path), ut.file_sha256(path), os.path.getsize(path))
+            )
+    on_disk = {date for date, _, _ in downloaded}
+    with con:
+        _insert_discovered(con, zip(df_url["date"], df_url["url"]))
+        _upsert_downloaded(con, downloaded)
+        _update_parsed(con, [date for date in parsed_dates if date in on_disk])
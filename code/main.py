@@ -1,53 +1,70 @@
-import pandas as pd
 import scraping_funcs as scr
 import merging_funcs as mrg
-import plots
-import os
-import utils as ut
+import render
 import html_func as h
+import storage
+
 
 # # Update your data to latest available
 def scrape_update_data():
     scr.get_reports_urls()
     scr.download_reports()
     scr.get_info_from_reports()
-    scr.download_sum_stats()
-    scr.download_vaccination_data()
+    # False -> source unchanged since last run (served from the http cache)
+    changed = {
+        "sum_stats": scr.download_sum_stats(),
+        "vaccination": scr.download_vaccination_data(),
+    }
+    print(f"Sources changed since last run: {changed}")
+
+    return changed
 
 
-def merge_datasets():
+def merge_datasets(full=False):
     # Merge 3 datasets -> covid_stats_from_database, covid_stats_from_pdf_daily_reports & vaccination datasets
     # Load grouped data downloaded from database
-    df_grp = pd.read_csv("../data/dataset_sum_daily_stats.csv", index_col=[0])
-    df_grp["date"] = pd.to_datetime(df_grp["date"], format="%Y-%m-%d")
+    df_grp = storage.load("dataset_sum_daily_stats")
 
     # Load data gathered from individual daily reports
-    df_ind = pd.read_csv("../data/data_from_pdf_reports.csv", index_col=[0])
-    df_ind["date"] = pd.to_datetime(df_ind["date"], format="%Y-%m-%d")
+    df_ind = storage.load("data_from_pdf_reports")
+    df_ind = df_ind.sort_values("date")  # reports are appended as parsed
 
-    # Merge datasets
-    df_ex1 = mrg.add_missing_cases_deaths_to_group_data(df_grp, df_ind)
-    df_ex2 = mrg.add_vaccination_percentage(df_ex1, df_ind)
+    # Only new days are merged, unless data before the last merged day changed
+    inputs = {"dataset_sum_daily_stats": df_grp, "data_from_pdf_reports": df_ind}
+    state = mrg.load_merge_state()
+    if (
+        not full
+        and storage.exists("dataset_extented")
+        and storage.exists("dataset_extented_sources")
+        and mrg.can_merge_incrementally(state, inputs)
+    ):
+        df_ex, df_sources = mrg.merge_new_days(
+            storage.load("dataset_extented"),
+            storage.load("dataset_extented_sources"),
+            df_grp,
+            df_ind,
+            state["last_date"],
+        )
+    else:
+        df_ex, df_sources = mrg.extended_dataset(df_grp, df_ind)
 
-    # Save extented dataset
-    df_ex2.to_csv("../data/dataset_extented.csv")
+    # Save extented dataset & the source of each value in it
+    storage.save(df_ex, "dataset_extented")
+    storage.save(df_sources, "dataset_extented_sources", export_csv=False)
+    mrg.save_merge_state(df_ex, inputs)
 
 
-def make_plots():
+def make_plots(workers=None, png_mode=None):
+    """png_mode: "full" (default, weekly), "preview" or "skip" (daily runs)"""
 
     print("Baking the plots...")
 
-    # Load extented dataset
-    df = pd.read_csv("../data/dataset_extented.csv", index_col=[0])
-    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d")
-
-    # Load vaccination data
-    dfv = pd.read_csv("../data/vaccination_dataset.csv", index_col=[0])
-    plots.cases_hosp_death(df)
-    plots.hospitalizations_per_vaccination(df)
-    plots.hospitalizations_per_vacc_per_100_00(df, dfv)
-    plots.hospitalizations_by_severity(df)
-    plots.vaccinations_by_age(dfv)
+    # Load extented dataset & vaccination data once, shared by all figures
+    inputs = {
+        "df": storage.load("dataset_extented"),
+        "dfv": storage.load("vaccination_dataset"),
+    }
+    render.render_all(inputs, workers=workers, png_mode=png_mode)
 
 
 def run():
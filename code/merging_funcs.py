@@ -1,72 +1,30 @@
-import numpy as np
+import hashlib
+import json
+import os
+
 import pandas as pd
 
+import corrections as crr
+import reconcile as rc
+
+PATH_MERGE_STATE = "../data/merge_state.json"
+# Bump when the merge changes -> next merge recomputes everything (same when the
+# corrections in data/corrections.csv change)
+MERGE_VERSION = 2
+
 
-def add_missing_cases_deaths_to_group_data(df1, df2):
-    """Add cases & deaths for dates missing from group_data"""
-
-    print("Merging group_data with data from individual pdf reports..")
-
-    last_date_group = df1["date"].iloc[-1].date()
-    last_date_indivreports = df2["date"].iloc[-1].date()
-    if last_date_indivreports > last_date_group:
-        columns_keep = [
-            "date",
-            "daily new cases",
-            "daily deaths",
-            "hospitalizations_dailyrep",
-        ]  # columns to add now
-        df_extra = df2[columns_keep].query(
-            "date > @last_date_group"
-        )  # get missing dates
-        df_extra = df_extra.rename(
-            columns={"hospitalizations_dailyrep": "Hospitalised Cases"}
-        )
-        columns_diff = [
-            col
-            for col in df1.columns.to_list()
-            if col not in df_extra.columns.to_list()
-        ]  # get difference of columns
-        for col in columns_diff:
-            df_extra[col] = np.nan  # fill new columns with nan
-
-        # Concatenate
-        df_extra = pd.concat([df1, df_extra], axis=0)
-    else:
-        print("No new additional cases & death info..")
-        df_extra = df1
-
-    # Apply corrections to extended stats
-    # TODO: Apply this corrections in a different function
-    # Corrections 1: In summary database from data.gov.cy deaths for 2022-01-18 are 3 but according to the pdf-report is 5
-    # -> use 5 (they initially announced 3, then updated to 5)
-    # print(df_extra.query("date == '2022-01-18'"))
-    df_extra.loc[df_extra["date"] == "2022-01-18", "daily deaths"] = 5.0
-    # print(df_extra.query("date == '2022-01-18'"))
-    # Corrections 2: In summary database from data.gov.cy hospitalizations for 2022-01-23 are 329 but according to the pdf-report is 238
-    df_extra.loc[df_extra["date"] == "2022-01-23", "Hospitalised Cases"] = 238
-
-    return df_extra
-
-
-def add_vaccination_percentage(df1, df_vacc):
-    """Add vaccination info for hospitalizations"""
-
-    df_vacc_info = df_vacc[
-        [
-            "date",
-            "perc_hosp_unvaccinated",
-            "perc_hosp_vaccinated",
-            "hospitalizations_dailyrep",
-        ]
-    ]
-    df_vacc_info = df_vacc_info.rename(
-        columns={"hospitalizations_dailyrep": "Hospitalizations from reports"}
+def rows_between(df, after=None, until=None):
+    """Rows of df (sorted by "date") w after < date <= until, found by binary search"""
+    dates = pd.DatetimeIndex(df["date"])
+    start = 0 if after is None else dates.searchsorted(pd.Timestamp(after), "right")
+    stop = (
+        len(df) if until is None else dates.searchsorted(pd.Timestamp(until), "right")
     )
-    df_extent = df1.merge(df_vacc_info, on="date", how="left")
-    # last_date_boost = str(df_extent["date"].iloc[-1].date()).replace("-", "_")
+    return df.iloc[start:stop]
 
-    # Add numer of vacc and uvnacc hospitalisations
+
+def add_hospitalized_by_vaccination(df_extent):
+    """Add numer of vacc and uvnacc hospitalisations"""
     df_extent["n_hospitalized_unvaccinated"] = (
         df_extent["Hospitalised Cases"] * df_extent["perc_hosp_unvaccinated"] / 100
     )
@@ -75,3 +33,97 @@ def add_vaccination_percentage(df1, df_vacc):
     )
 
     return df_extent
+
+
+def fingerprint(df, last_date):
+    """sha256 of the rows (& columns) of df up to last_date"""
+    rows = rows_between(df, until=last_date)
+    sha = hashlib.sha256("|".join(map(str, rows.columns)).encode("utf-8"))
+    sha.update(pd.util.hash_pandas_object(rows, index=False).values.tobytes())
+    return sha.hexdigest()
+
+
+def load_merge_state(path_state=PATH_MERGE_STATE):
+    if not os.path.isfile(path_state):
+        return None
+    with open(path_state, "r") as f:
+        return json.load(f)
+
+
+def save_merge_state(df_extent, inputs, path_state=PATH_MERGE_STATE):
+    """Store the last merged date & the fingerprints of the inputs {name: df} up to it"""
+    last_date = str(df_extent["date"].max().date())
+    state = {
+        "version": MERGE_VERSION,
+        "corrections": crr.overlay_fingerprint(),
+        "last_date": last_date,
+        "fingerprints": {
+            name: fingerprint(df, last_date) for name, df in inputs.items()
+        },
+    }
+    with open(path_state + ".tmp", "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(path_state + ".tmp", path_state)
+
+
+def can_merge_incrementally(state, inputs):
+    """True if the inputs {name: df} did not change up to the last merged date"""
+    if state is None or state["version"] != MERGE_VERSION:
+        return False
+    if state.get("corrections") != crr.overlay_fingerprint():
+        return False
+    return all(
+        state["fingerprints"].get(name) == fingerprint(df, state["last_date"])
+        for name, df in inputs.items()
+    )
+
+
+# Sources of the extended dataset (see reconcile.py):
+# data.gov.cy summary csv first, the pdf-reports add the days it has not published yet
+# & the vaccination percentages, manual corrections (data/corrections.csv) override both
+rc.register_source("data.gov.cy", priority=1)
+rc.register_source(
+    "pdf_reports",
+    columns={
+        "daily new cases": "daily new cases",
+        "daily deaths": "daily deaths",
+        "Hospitalised Cases": "hospitalizations_dailyrep",
+        "perc_hosp_unvaccinated": "perc_hosp_unvaccinated",
+        "perc_hosp_vaccinated": "perc_hosp_vaccinated",
+        "Hospitalizations from reports": "hospitalizations_dailyrep",
+    },
+    fresh_only=["daily new cases", "daily deaths", "Hospitalised Cases"],
+    rows="fresh",
+)
+rc.register_source("corrections", priority=2, rows="none")
+
+
+def extended_dataset(df_grp, df_ind, after=None):
+    """Extended dataset from the group data & the reports (only days after `after`)
+
+    Returns (df_extent, df_sources) -> df_sources has the source of each value
+    """
+    print("Reconciling group_data, data from individual pdf reports & corrections..")
+    frames = {
+        "data.gov.cy": df_grp,
+        "pdf_reports": df_ind,
+        "corrections": crr.corrections_frame(),
+    }
+    df_extent, df_sources = rc.reconcile(frames, after=after)
+    return add_hospitalized_by_vaccination(df_extent), df_sources
+
+
+def merge_new_days(df_extent, df_sources, df_grp, df_ind, last_date):
+    """Extend the merged dataset (& its sources) w the days after last_date"""
+    df_new, df_new_sources = extended_dataset(df_grp, df_ind, after=last_date)
+    if df_new.empty:
+        print("No new days to merge..")
+        return df_extent, df_sources
+    print(f"Merging {len(df_new)} new days..")
+
+    df_new.index = range(len(df_extent), len(df_extent) + len(df_new))
+    df_new_sources.index = df_new.index
+    return (
+        pd.concat([df_extent, df_new], axis=0),
+        pd.concat([df_sources, df_new_sources], axis=0),
+    )
@@ -0,0 +1,214 @@
+"""Backends turning a pdf into text, page by page
+
+Each backend is a generator function (path, maxpages) -> text of each page.
+`python pdf_backends.py` calibrates them on data/reports and stores the fastest one
+that extracts the same numbers as data_from_pdf_reports.csv (used by utils.pdf_to_text).
+"""
+
+import functools
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pdfminer
+import extraction as ex
+from pdfminer.converter import TextConverter
+from pdfminer.layout import LAParams
+from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfpage import PDFPage
+
+try:
+    import pypdf
+except ImportError:
+    pypdf = None
+
+DEFAULT_BACKEND = "pdfminer_layout"
+PATH_SELECTED_BACKEND = "../data/pdf_backend.json"
+# columns of the extended dataset only the pdf-reports give (a correction of one of
+# them -> the pdf of that date is wrong/missing, see load_golden)
+REPORT_ONLY_COLUMNS = [
+    "Hospitalizations from reports",
+    "perc_hosp_unvaccinated",
+    "perc_hosp_vaccinated",
+]
+
+
+def _pdfminer_pages(path, maxpages, laparams):
+    with open(path, "rb") as fp:
+        rsrcmgr = PDFResourceManager()
+        outfp = io.StringIO()
+        device = TextConverter(rsrcmgr, outfp, laparams=laparams)
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        for page in PDFPage.get_pages(fp, maxpages=maxpages):
+            interpreter.process_page(page)
+            yield outfp.getvalue()
+            outfp.seek(0)
+            outfp.truncate(0)
+        device.close()
+
+
+def pdfminer_layout(path, maxpages=0):
+    """pdfminer w layout analysis (default LAParams)"""
+    return _pdfminer_pages(path, maxpages, LAParams())
+
+
+def pdfminer_nolayout(path, maxpages=0):
+    """pdfminer w/o layout analysis (text in content-stream order)"""
+    return _pdfminer_pages(path, maxpages, None)
+
+
+def pypdf_pages(path, maxpages=0):
+    reader = pypdf.PdfReader(path)
+    pages = reader.pages if not maxpages else reader.pages[:maxpages]
+    for page in pages:
+        yield page.extract_text() + "\n"
+
+
+def pdftotext_pages(path, maxpages=0):
+    """poppler's pdftotext binary, whole document in one call"""
+    cmd = ["pdftotext", "-enc", "UTF-8", "-layout"]
+    if maxpages:
+        cmd += ["-l", str(maxpages)]
+    result = subprocess.run(cmd + [path, "-"], capture_output=True, check=True)
+    yield result.stdout.decode("utf-8")
+
+
+BACKENDS = {
+    "pdfminer_layout": pdfminer_layout,
+    "pdfminer_nolayout": pdfminer_nolayout,
+    "pypdf": pypdf_pages,
+    "pdftotext": pdftotext_pages,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def backend_version(name):
+    """Version of the library/binary behind a backend (part of the text cache key)"""
+    if name.startswith("pdfminer"):
+        return pdfminer.__version__
+    if name == "pypdf":
+        return pypdf.__version__
+    if name == "pdftotext":
+        result = subprocess.run(["pdftotext", "-v"], capture_output=True)
+        return (result.stderr or result.stdout).decode("utf-8").splitlines()[0]
+    raise KeyError(name)
+
+
+def available_backends():
+    names = ["pdfminer_layout", "pdfminer_nolayout"]
+    if pypdf is not None:
+        names.append("pypdf")
+    if shutil.which("pdftotext"):
+        names.append("pdftotext")
+    return names
+
+
+_selected_backend = None
+
+
+def selected_backend(path_selected=PATH_SELECTED_BACKEND):
+    """Backend chosen by the last calibration (DEFAULT_BACKEND if none/not available)"""
+    global _selected_backend
+    if _selected_backend is None:
+        _selected_backend = DEFAULT_BACKEND
+        if os.path.isfile(path_selected):
+            with open(path_selected, "r") as f:
+                name = json.load(f)["backend"]
+            if name in available_backends():
+                _selected_backend = name
+    return _selected_backend
+
+
+def load_golden(path_golden="../data/data_from_pdf_reports.csv"):
+    """Golden values by date: data_from_pdf_reports.csv w/o the dates whose report
+    values are corrected by hand (numbers from PIO announcements for missing/wrong
+    pdfs, no backend gives them)"""
+    import pandas as pd
+    import corrections as crr
+
+    golden = pd.read_csv(path_golden, index_col=[0]).set_index("date")
+    golden = golden[~golden.index.duplicated(keep="last")]
+    overlay = crr.load_corrections()
+    corrected = overlay.loc[overlay["column"].isin(REPORT_ONLY_COLUMNS), "date"]
+    return golden.drop(corrected.dt.strftime("%Y-%m-%d"), errors="ignore")
+
+
+def calibrate(
+    path_reports="../data/reports",
+    path_golden="../data/data_from_pdf_reports.csv",
+    path_selected=PATH_SELECTED_BACKEND,
+):
+    """Measure every backend on the reports & select the fastest one giving golden values
+
+    Golden values are the numbers in data_from_pdf_reports.csv (see load_golden). A
+    backend qualifies only if it extracts these numbers (the fields required by the
+    template of the report, see golden_harness.matches_golden) from every report that
+    has a golden row. The selection is stored in path_selected.
+    """
+    import glob
+    import golden_harness as gh
+    import utils as ut
+
+    global _selected_backend
+
+    golden = load_golden(path_golden)
+    paths = [
+        path
+        for path in sorted(glob.glob(path_reports + "/*.pdf"))
+        if ut.report_date(path) in golden.index
+    ]
+    print(f"Calibrating pdf backends on {len(paths)} reports w golden values...")
+
+    results = {}
+    for name in available_backends():
+        n_agree = 0
+        t_start = time.perf_counter()
+        for path in paths:
+            date = ut.report_date(path)
+            template = ex.template_for(date)
+            try:
+                text = ut.pdf_to_text(
+                    path,
+                    maxpages=ut.REPORT_MAXPAGES,
+                    stop_when_complete=ut.report_complete_check(path),
+                    backend=name,
+                )
+                info = template.extract(ut.normalize_report_text(text))
+            except Exception:
+                continue
+            n_agree += all(
+                gh.matches_golden(getattr(info, field), golden.loc[date, column])
+                for column, field in gh.FIELDS.items()
+                if field in template.required
+            )
+        seconds = time.perf_counter() - t_start
+        results[name] = {
+            "reports_per_second": len(paths) / seconds if seconds else None,
+            "agreement": n_agree / len(paths) if paths else None,
+        }
+        print(
+            f"{name:18}: {results[name]['reports_per_second']:6.1f} reports/s, "
+            f"{n_agree}/{len(paths)} reports w golden values"
+        )
+
+    identical = [name for name, r in results.items() if r["agreement"] == 1.0]
+    if not identical:
+        print(f"No backend reproduces the golden values, keeping {DEFAULT_BACKEND}.")
+        best = DEFAULT_BACKEND
+    else:
+        best = max(identical, key=lambda name: results[name]["reports_per_second"])
+        print(f"Selected backend: {best}")
+
+    with open(path_selected, "w") as f:
+        json.dump({"backend": best, "calibration": results}, f, indent=1)
+    _selected_backend = None
+
+    return best
+
+
+if __name__ == "__main__":
+    calibrate(*sys.argv[1:])
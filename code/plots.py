@@ -3,6 +3,8 @@ import plotly.express as px
 import plotly.graph_objects as go
 from datetime import datetime, timedelta
 
+import png_export
+
 # Disable "chained_assignment" warning
 # https://stackoverflow.com/questions/20625582/how-to-deal-with-settingwithcopywarning-in-pandas
 import pandas as pd
@@ -11,6 +13,7 @@ pd.options.mode.chained_assignment = None  # default='warn'
 
 PLOTS_WIDTH = 900
 PLOTS_HEIGHT = 600
+LANGUAGES = ["eng", "gr"]
 
 
 def save_figure_many_forms(fig, filename, png_w, png_h, png_scale):
@@ -31,16 +34,11 @@ def save_figure_many_forms(fig, filename, png_w, png_h, png_scale):
         full_html=False,
     )
 
-    # 3. PNG
-    fig.write_image(
-        file=f"../plots/{filename}.png",
-        width=png_w,
-        height=png_h,
-        scale=3.0,
-    )
+    # 3. PNG (queued while rendering in batch, skipped or low-scale w some modes)
+    png_export.write_png(fig, f"../plots/{filename}.png", png_w, png_h, png_scale)
 
 
-def cases_hosp_death(df):
+def cases_hosp_death(df, languages=LANGUAGES):
     """The classical plot with time course of cases, hospitalizations & deaths"""
     # df = df.query("date<='2022-01-13'")
     # print(df["date"].iloc[-1])
@@ -70,7 +68,6 @@ def cases_hosp_death(df):
 
     # For cases-hosp-deaths plot
     last_date_df = df["date"].iloc[-1].strftime("%d %B, %Y")
-    languages = ["eng", "gr"]
     columns = {"number": {"eng": "Number", "gr": "Αριθμός"}}
     titles = {
         "eng": f"Daily new cases, hospitalizations & deaths related to COVID-19 <br>(until {last_date_df})",
@@ -247,11 +244,10 @@ def cases_hosp_death(df):
         save_figure_many_forms(fig, f"deaths_{lang}", PLOTS_WIDTH, PLOTS_HEIGHT, 3.0)
 
 
-def hospitalizations_per_vaccination(df):
+def hospitalizations_per_vaccination(df, languages=LANGUAGES):
     """Area figure with hospizalations time series per vaccination status"""
 
     # Define names of parameters in plot in multiple languag
-    languages = ["eng", "gr"]
     columns = {
         "n_hospitalized": {"eng": "Hospitalizations", "gr": "Νοσηλείες"},
         "Vaccination": {"eng": "", "gr": ""},
@@ -268,6 +264,9 @@ def hospitalizations_per_vaccination(df):
         },
     }
 
+    # Vaccination status in reports since 2021-07-16 (df sorted by date)
+    df = df.iloc[df["date"].searchsorted(pd.Timestamp("2021-07-16")) :]
+
     for lang in languages:
         print(f"Figure hospitilazions per vaccination status in : {lang}")
 
@@ -306,8 +305,7 @@ def hospitalizations_per_vaccination(df):
             .assign(Vaccination=categories["unvacc"][lang])
         )
 
-        df_h1 = pd.concat([df_vacc, df_unvacc])
-        df_h2 = df_h1.query("date >= '2021-07-16'")
+        df_h2 = pd.concat([df_vacc, df_unvacc])
         # Make plot
         fig = px.area(
             df_h2,
@@ -394,7 +392,7 @@ def date_in_mid_of_week(year_week):
     return date_mid_week[0]
 
 
-def hospitalizations_per_vacc_per_100_00(df, dfv):
+def hospitalizations_per_vacc_per_100_00(df, dfv, languages=LANGUAGES):
     """Plotting hospitalizations per vaccination status per 100_000 (vaccinated or unvaccinated)people"""
 
     # Add weeks to hospitalization_df in ascending order (ie not reset by year)
@@ -418,7 +416,7 @@ def hospitalizations_per_vacc_per_100_00(df, dfv):
     # Group_by - midweek
     dfhosp = df.groupby("midweek").mean()
 
-    dfhosp = dfhosp.reset_index().query("midweek >= '2021-07-16'")
+    dfhosp = dfhosp.loc["2021-07-16":].reset_index()  # sorted midweek index
     dfhosp["midweek"].iloc[0]
 
     # Add middle-of-week for vaccination dataset
@@ -466,9 +464,11 @@ def hospitalizations_per_vacc_per_100_00(df, dfv):
     # For now I am working assuming the second case.
     dfv2["Boosted"] = dfv2.apply(
         # lambda x: x["SecondDose"]
-        lambda x: x["SecondDose"] + x["DoseAdditional1"]
-        if x["Vaccine"] == "JANSS"
-        else x["DoseAdditional1"],
+        lambda x: (
+            x["SecondDose"] + x["DoseAdditional1"]
+            if x["Vaccine"] == "JANSS"
+            else x["DoseAdditional1"]
+        ),
         axis=1,
     )
 
@@ -530,7 +530,6 @@ def hospitalizations_per_vacc_per_100_00(df, dfv):
     )
 
     # Define names of parameters in plot in multiple languag
-    languages = ["eng", "gr"]
     columns = {
         "n_hospitalized": {"eng": "Hospitalizations", "gr": "Νοσηλείες"},
         "ratio_hosp_unvacc_vacc": {
@@ -707,7 +706,7 @@ def hospitalizations_per_vacc_per_100_00(df, dfv):
         )
 
 
-def hospitalizations_by_severity(df):
+def hospitalizations_by_severity(df, languages=LANGUAGES):
     """Plotting hospitalisations after categorizing them in ICU, ICU intubated and not ICU"""
 
     # Define names of parameters in plot in multiple languag
@@ -720,7 +719,6 @@ def hospitalizations_by_severity(df):
         .strftime("%d %B, %Y")
     )
 
-    languages = ["eng", "gr"]
     columns = {"hospit": {"eng": "Hospitalizations", "gr": "Νοσηλείες"}}
     titles = {
         "eng": f"Daily new hospitalizations by severity (until {last_date_df})",
@@ -902,7 +900,7 @@ def group_stats_targetgroup(df, target_str):
     return df_target
 
 
-def vaccinations_by_age(dfv):
+def vaccinations_by_age(dfv, languages=LANGUAGES):
 
     # Add data for 18+
     age_groups_18plus = [
@@ -954,11 +952,11 @@ def vaccinations_by_age(dfv):
 
     # Actual Plot
 
-    last_date = dfv["midweek"].iloc[-1] + timedelta(3)
+    # (not dfv["midweek"] -> the figure doesn't depend on the other plots)
+    last_date = date_in_mid_of_week(dfv["YearWeekISO"].iloc[-1]) + timedelta(3)
     last_date = last_date.strftime("%d %B, %Y")
 
     # Define names of parameters in plot in multiple languages
-    languages = ["eng", "gr"]
     columns = {
         "%_diff_prev_categ": {"eng": "Percentage", "gr": "Ποσοστό"},
         "target_group": {"eng": "Age group", "gr": "Ηλικιακή ομάδα"},
@@ -0,0 +1,103 @@
+"""PNG export of the figures, queued & written in one batch
+
+fig.write_image starts Kaleido (a Chromium process) for every PNG. While batching
+(see render.py) the figures only queue their PNGs, and write_queued writes them all
+w one long-lived Kaleido server rendering TABS PNGs at a time (kaleido >= 1, older
+kaleido keeps its own process between write_image calls).
+
+Modes: "full" -> PNGs at the scale of the figure (3x, e.g. for a weekly run),
+"preview" -> low-scale PNGs, as <name>_preview.png next to the full ones (kept), &
+"skip" -> no PNGs (daily runs, the site uses the html)
+"""
+
+import json
+import os
+
+import plotly.io as pio
+
+try:
+    import kaleido
+except ImportError:
+    kaleido = None
+
+MODES = ("full", "preview", "skip")
+MODE = "full"
+PREVIEW_SCALE = 1.0
+TABS = 4  # PNGs rendered concurrently by the Kaleido server
+
+_queue = None  # queued PNGs while batching, None -> each PNG is written right away
+
+
+def set_mode(mode):
+    global MODE
+    if mode not in MODES:
+        raise ValueError(f"PNG mode must be one of {MODES}, not {mode}")
+    MODE = mode
+
+
+def preview_path(file):
+    """'../plots/name.png' -> '../plots/name_preview.png'"""
+    root, ext = os.path.splitext(file)
+    return f"{root}_preview{ext}"
+
+
+def start_batch():
+    """Queue the PNGs of the figures made from now on, instead of writing them"""
+    global _queue
+    _queue = []
+
+
+def end_batch():
+    """Stop batching -> the queued PNGs (to be written w write_queued)"""
+    global _queue
+    queued, _queue = _queue or [], None
+    return queued
+
+
+def write_png(fig, file, width, height, scale):
+    """Write (or queue, while batching) the PNG of fig according to MODE"""
+    if MODE == "skip":
+        return
+    if MODE == "preview":
+        scale = PREVIEW_SCALE
+        file = preview_path(file)
+    # figure as json -> the queue can be sent from the render workers to the parent
+    png = {
+        "fig": fig.to_json(),
+        "file": file,
+        "width": width,
+        "height": height,
+        "scale": scale,
+    }
+    if _queue is None:
+        write_queued([png])
+    else:
+        _queue.append(png)
+
+
+def write_queued(pngs):
+    """Write the PNGs [{fig (json), file, width, height, scale}] in one batch"""
+    if not pngs:
+        return
+    if not hasattr(kaleido, "start_sync_server"):
+        for png in pngs:
+            pio.write_image(
+                pio.from_json(png["fig"]),
+                png["file"],
+                width=png["width"],
+                height=png["height"],
+                scale=png["scale"],
+            )
+        return
+
+    kaleido.start_sync_server(n=TABS, silence_warnings=True)
+    try:
+        pio.write_images(
+            [json.loads(png["fig"]) for png in pngs],
+            [png["file"] for png in pngs],
+            width=[png["width"] for png in pngs],
+            height=[png["height"] for png in pngs],
+            scale=[png["scale"] for png in pngs],
+        )
+    finally:
+        kaleido.stop_sync_server(silence_warnings=True)
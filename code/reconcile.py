@@ -0,0 +1,179 @@
+"""Reconciliation of daily stats from any number of sources
+
+Each registered source gives some columns of the result, each column w a priority
+(the highest priority source w a value for a date wins, lower ones fill its gaps).
+Freshness: columns in `fresh_only` are taken from a source only for dates after the
+last date of the sources w higher priority for that column (e.g. the pdf-reports
+give the days data.gov.cy has not published yet, but don't fill its gaps). Sources
+w rows="none" (overlays, e.g. manual corrections) only patch cells, their dates
+don't count for freshness.
+
+All sources are aligned once on the union of their dates, and each column is
+picked over all dates at once. The result comes w a frame of the same shape
+telling which source each cell came from.
+"""
+
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+Source = namedtuple(
+    "Source", ["name", "columns", "priority", "priorities", "fresh_only", "rows"]
+)
+SOURCES = []
+ROWS = ("all", "fresh", "none")
+
+
+def register_source(
+    name, columns=None, priority=0, priorities=None, fresh_only=(), rows="all"
+):
+    """Register a source of daily stats (its frame is given to reconcile by name)
+
+    :param columns: {column of the result: column of the source}
+        (default: all columns of the source, w the same names)
+    :param priority: priority of its columns, unless in priorities {column: priority}
+    :param fresh_only: columns taken only for dates after the last date of the
+        sources w higher priority for that column
+    :param rows: "all" -> each of its dates is a row of the result, "fresh" -> only
+        its dates after the last date of the sources w rows="all", "none" -> no rows
+    """
+    if rows not in ROWS:
+        raise ValueError(f"rows must be one of {ROWS}, not {rows}")
+    if any(source.name == name for source in SOURCES):
+        raise ValueError(f"Source {name} is already registered")
+    SOURCES.append(
+        Source(name, columns, priority, dict(priorities or {}), tuple(fresh_only), rows)
+    )
+
+
+def _column_map(source, columns):
+    if source.columns is None:
+        return {column: column for column in columns}
+    return source.columns
+
+
+def _positions(dates, index):
+    """Row of dates for each date of index (-1 -> none), by binary search if sorted"""
+    if not len(dates) or not dates.is_monotonic_increasing:
+        return dates.get_indexer(index)
+    positions = dates.searchsorted(index)
+    positions[positions == len(dates)] = 0
+    return np.where(dates.values[positions] == index.values, positions, -1)
+
+
+def _numeric(values):
+    return isinstance(values, np.ndarray) and values.dtype.kind in "iuf"
+
+
+def _align(series, dates, positions, index):
+    """Values of a source column on the rows of the result, as series.reindex would
+    give them (positions: row of the source for each row, -1 -> none)"""
+    if not isinstance(series.dtype, np.dtype) or series.dtype.kind not in "iuf":
+        return series.set_axis(dates).reindex(index)  # e.g. nullable (compact) dtypes
+    values = series.to_numpy()
+    found = positions >= 0
+    if found.all():
+        return values[positions]
+    aligned = np.full(
+        len(positions), np.nan, values.dtype if values.dtype.kind == "f" else float
+    )
+    aligned[found] = values[positions[found]]
+    return aligned
+
+
+def _pick(picked, index):
+    """Values of a column from [(mask, aligned values)] of its sources (the masks
+    don't overlap), NaN where none gives one, w the dtype Series.where would give"""
+    first_take, first = picked[0]
+    if not all(_numeric(values) for _, values in picked):
+        column_values = pd.Series(first, index=index).where(first_take)
+        for take, values in picked[1:]:
+            column_values = column_values.where(~take, pd.Series(values, index=index))
+        return column_values
+
+    if first_take.all():
+        return first
+    dtype = np.result_type(*[values.dtype for _, values in picked])
+    column_values = np.full(len(index), np.nan, dtype if dtype.kind == "f" else float)
+    for take, values in picked:
+        column_values[take] = values[take]
+    return column_values
+
+
+def reconcile(frames, after=None, sources=None):
+    """Daily stats from the frames {source name: df w a "date" column}
+
+    :param after: only rows after this date (the sources are still taken whole
+        for the freshness rules)
+    Returns (df, df_sources): both w a "date" column & the same columns, df_sources
+    has the name of the source of each value (None where no source has a value).
+    """
+    sources = [s for s in (SOURCES if sources is None else sources) if s.name in frames]
+    dates = {}
+    for source in sources:
+        dates[source.name] = pd.DatetimeIndex(frames[source.name]["date"])
+        if not dates[source.name].is_unique:
+            raise ValueError(f"Source {source.name} has more than one row per date")
+
+    # Rows: all dates of the "all" sources + the later dates of the "fresh" ones
+    index = pd.DatetimeIndex([])
+    for source in sources:
+        if source.rows == "all":
+            index = index.union(dates[source.name])
+    last_all = index[-1] if len(index) else pd.Timestamp.min
+    for source in sources:
+        if source.rows == "fresh":
+            source_dates = dates[source.name]
+            index = index.union(source_dates[source_dates > last_all])
+    if after is not None:
+        index = index[index > pd.Timestamp(after)]
+
+    # Candidates of each column, by priority (registration order between equals)
+    candidates = {}
+    for order, source in enumerate(sources):
+        columns = [c for c in frames[source.name].columns if c != "date"]
+        for column, source_column in _column_map(source, columns).items():
+            priority = source.priorities.get(column, source.priority)
+            candidates.setdefault(column, []).append(
+                (-priority, order, source, source_column)
+            )
+
+    # Rows of each source aligned once on the rows of the result, the columns are
+    # then picked over all rows at once w numpy masks
+    positions = {
+        name: _positions(source_dates, index) for name, source_dates in dates.items()
+    }
+    values, origins = {}, {}
+    for column, column_candidates in candidates.items():
+        picked = []  # (mask of the rows it gives, aligned values) of its sources
+        free = np.ones(len(index), dtype=bool)  # rows w/o a value yet
+        origin = np.full(len(index), None, dtype=object)
+        last_covered = pd.Timestamp.min  # last date of the higher priority sources
+        for _, _, source, source_column in sorted(
+            column_candidates, key=lambda c: c[:2]
+        ):
+            source_dates = dates[source.name]
+            aligned = _align(
+                frames[source.name][source_column],
+                source_dates,
+                positions[source.name],
+                index,
+            )
+            take = free & np.asarray(pd.notna(aligned))
+            if column in source.fresh_only:
+                take &= index > last_covered
+            if not picked or take.any():
+                picked.append((take, aligned))
+                free &= ~take
+                origin[take] = source.name
+            # overlays don't cover dates
+            if len(source_dates) and source.rows != "none":
+                last_covered = max(last_covered, source_dates.max())
+        values[column] = _pick(picked, index)
+        origins[column] = origin
+
+    df = pd.DataFrame(values, index=index).rename_axis("date").reset_index()
+    df_sources = pd.DataFrame(origins, index=index, dtype=object)
+    df_sources = df_sources.rename_axis("date").reset_index()
+    return df, df_sources
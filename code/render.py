@@ -0,0 +1,98 @@
+"""Render the figures in parallel, one job per (figure, language)
+
+The inputs are loaded once by the parent & handed to each worker process once (not
+once per job). Each job gets its own copy of the inputs, since the plot functions
+add columns to them. The workers return the PNGs of their figures, which are
+written in one batch by the parent at the end (see png_export.py).
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import plots
+import png_export
+
+# Figure -> (plot function, names of its inputs)
+FIGURES = {
+    "cases_hosp_death": (plots.cases_hosp_death, ["df"]),
+    "hospitalizations_per_vaccination": (
+        plots.hospitalizations_per_vaccination,
+        ["df"],
+    ),
+    "hospitalizations_per_vacc_per_100_00": (
+        plots.hospitalizations_per_vacc_per_100_00,
+        ["df", "dfv"],
+    ),
+    "hospitalizations_by_severity": (plots.hospitalizations_by_severity, ["df"]),
+    "vaccinations_by_age": (plots.vaccinations_by_age, ["dfv"]),
+}
+
+_inputs = {}  # inputs of the jobs in this (worker) process
+
+
+def _init_worker(inputs, png_mode):
+    _inputs.update(inputs)
+    png_export.set_mode(png_mode)
+
+
+def render_job(figure, lang):
+    """Make one figure in one language
+
+    Returns (figure, lang, wall-clock seconds, its queued PNGs)
+    """
+    func, input_names = FIGURES[figure]
+    start = time.perf_counter()
+    png_export.start_batch()
+    try:
+        func(*[_inputs[name].copy() for name in input_names], languages=[lang])
+    finally:
+        pngs = png_export.end_batch()
+    return figure, lang, time.perf_counter() - start, pngs
+
+
+def render_all(
+    inputs, figures=None, languages=plots.LANGUAGES, workers=None, png_mode=None
+):
+    """Make the figures (default: all) in all languages on a pool of `workers`
+    processes (default: one per cpu, 1 -> no pool)
+
+    :param inputs: {"df": extended dataset, "dfv": vaccination dataset}
+    :param png_mode: "full", "preview" or "skip" (default: png_export.MODE)
+    Returns [(figure, lang, seconds)] of the jobs
+    """
+    png_mode = png_mode or png_export.MODE
+    jobs = [(figure, lang) for figure in figures or FIGURES for lang in languages]
+    workers = min(workers or os.cpu_count() or 1, len(jobs))
+
+    start = time.perf_counter()
+    if workers <= 1:
+        # jobs in this process -> its PNG mode (& inputs) are restored afterwards
+        mode = png_export.MODE
+        _init_worker(inputs, png_mode)
+        try:
+            results = [render_job(*job) for job in jobs]
+        finally:
+            png_export.set_mode(mode)
+            _inputs.clear()
+    else:
+        with ProcessPoolExecutor(
+            workers, initializer=_init_worker, initargs=(inputs, png_mode)
+        ) as pool:
+            futures = [pool.submit(render_job, *job) for job in jobs]
+            results = [future.result() for future in futures]
+    total = time.perf_counter() - start
+
+    # PNGs of all figures in one batch
+    pngs = [png for *_, job_pngs in results for png in job_pngs]
+    start_png = time.perf_counter()
+    png_export.write_queued(pngs)
+    total_png = time.perf_counter() - start_png
+    timings = [result[:3] for result in results]
+
+    print(f"Rendered {len(jobs)} figures on {workers} processes:")
+    for figure, lang, seconds in timings:
+        print(f"  {figure:<40} {lang:<4} {seconds:6.1f} s")
+    print(f"  {'total (wall-clock)':<45} {total:6.1f} s")
+    print(f"  {f'{len(pngs)} PNGs ({png_mode})':<45} {total_png:6.1f} s")
+    return timings
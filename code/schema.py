@@ -0,0 +1,76 @@
+"""Columns & dtypes of the datasets passed between stages
+
+Compact dtypes: counts as (nullable) int32, percentages as float32 & low-cardinality
+strings as categories. They are used by storage.load(..., compact=True), for frames
+kept in memory (smaller, but slower to load). The merge & plots load the exact
+dtypes (float64 etc), so the csv exports don't change.
+"""
+
+DATE = "date"  # date column, "YYYY-MM-DD" in the csv
+
+_DAILY_STATS = {
+    "date": DATE,
+    "daily new cases": "Int32",
+    "daily deaths": "Int32",
+    "Hospitalised Cases": "Int32",
+    "Severe Cases": "Int32",
+    "Cases In ICUs": "Int32",
+    "Incubated Cases": "Int32",
+    "PCR_daily tests performed": "Int32",
+    "RA_daily tests performed": "Int32",
+    "total_daily tests performed": "Int32",
+    "total cases": "Int32",
+    "total deaths": "Int32",
+    "total PCR tests": "Int32",
+    "total RA tests": "Int32",
+    "total tests": "Int32",
+    "Notes": "category",
+}
+
+SCHEMAS = {
+    "dataset_sum_daily_stats": _DAILY_STATS,
+    "data_from_pdf_reports": {
+        "date": DATE,
+        "hospitalizations_dailyrep": "Int32",
+        "perc_hosp_unvaccinated": "float32",
+        "daily new cases": "Int32",
+        "daily deaths": "Int32",
+        "perc_hosp_vaccinated": "float32",
+    },
+    "dataset_extented": {
+        **_DAILY_STATS,
+        "perc_hosp_unvaccinated": "float32",
+        "perc_hosp_vaccinated": "float32",
+        "Hospitalizations from reports": "Int32",
+        "n_hospitalized_unvaccinated": "float32",
+        "n_hospitalized_vaccinated": "float32",
+    },
+    # source (reconcile.py) of each value of dataset_extented, same columns
+    "dataset_extented_sources": {"date": DATE},
+    "vaccination_dataset": {
+        "YearWeekISO": "category",
+        "Denominator": "Int32",
+        "NumberDosesReceived": "Int32",
+        "NumberDosesExported": "Int32",
+        "FirstDose": "Int32",
+        "SecondDose": "Int32",
+        "DoseAdditional1": "Int32",
+        "District": "category",
+        "TargetGroup": "category",
+        "Vaccine": "category",
+        "Population": "Int32",
+    },
+}
+
+
+def date_columns(name):
+    return [column for column, dtype in SCHEMAS[name].items() if dtype == DATE]
+
+
+def compact_dtypes(name, columns=None):
+    """{column: dtype} of the (requested) non-date columns of dataset `name`"""
+    return {
+        column: dtype
+        for column, dtype in SCHEMAS[name].items()
+        if dtype != DATE and (columns is None or column in columns)
+    }
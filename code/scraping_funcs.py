@@ -2,13 +2,42 @@ import pandas as pd
 import numpy as np
 import glob
 import os
+import io
 import utils as ut
+import http_cache as hc
+import ledger
+import storage
 
+PATH_DB = "../data/database_url_reports.csv"
+PATH_REPORTS = "../data/reports"
+PATH_INFO_REPORTS = "../data/data_from_pdf_reports.csv"
 
-def get_reports_urls():
-    """Creates df with urls for all available pdf daily reports in PIO website"""
+
+# Stop scanning the PIO page after this many consecutive links that are already in the catalog
+STOP_AFTER_KNOWN = 20
+
+
+def load_url_catalog(path_db):
+    """Load the catalog of report urls (empty if it doesn't exist yet)"""
+    if os.path.isfile(path_db):
+        return pd.read_csv(path_db, index_col=[0])
+    return pd.DataFrame(columns=["date", "url", "url_perc"])
+
+
+def get_reports_urls(stop_after_known=STOP_AFTER_KNOWN):
+    """Adds urls of new pdf daily reports in PIO website to the url catalog
+
+    Only links not already in the catalog are processed. Links in the page are newest first,
+    so scanning stops once `stop_after_known` consecutive links are already known.
+    """
 
     URL_PIO = "https://www.pio.gov.cy/coronavirus/categories/press#30"
+
+    # Load existing catalog, index its urls as a set
+    df_url_db = load_url_catalog(PATH_DB)
+    known_urls = set(df_url_db["url"])
+    print(f"Url catalog contains {len(known_urls)} reports.")
+
     print("Collecting urls for all files in PIO website...")
     list_of_links = ut.find_files_from_url(URL_PIO)
     # print("Some examples of links in website...")
@@ -19,9 +48,26 @@ def get_reports_urls():
     # print("Some examples of links to daily reports...")
     # ut.print_first_x_elements(links_daily_reports, 5)
 
+    # Keep only links not seen before
+    new_links = []
+    n_known_in_row = 0
+    for link in links_daily_reports:
+        if link in known_urls:
+            n_known_in_row += 1
+            if n_known_in_row >= stop_after_known:
+                print("Reached reports already in the catalog, stop scanning.")
+                break
+            continue
+        n_known_in_row = 0
+        new_links.append(link)
+        known_urls.add(link)  # the same link can appear twice in the page
+    print(f"Found {len(new_links)} new reports.")
+    if not new_links:
+        return
+
     # Extract date as datetime from url
     print("Extracting date from url...")
-    dt_reports = [ut.extract_datetime(link) for link in links_daily_reports]
+    dt_reports = ut.extract_datetimes(new_links)
     # print("Some examples of datetime extracted from link...")
     # ut.print_first_x_elements(dt_reports, 5)
 
@@ -32,141 +78,182 @@ def get_reports_urls():
 
     # Get all urls as percent-encoded
     print("Transforming urls to percent-encoded...")
-    links_perc_encoded = [ut.percent_encode_url(url) for url in links_daily_reports]
+    links_perc_encoded = [ut.percent_encode_url(url) for url in new_links]
     # print("Some examples of percent-encoded links..")
     # ut.print_first_x_elements(links_perc_encoded, 5)
 
-    ### Create df with date & URLs for pdf reports
+    ### Create df with date & URLs for the new pdf reports
 
     # Add date and url in a dataframe
-    df_url_reports = pd.DataFrame(
+    first_index = df_url_db.index.max() + 1 if not df_url_db.empty else 0
+    df_url_new = pd.DataFrame(
         {
-            "date": dt_reports,
-            "url": links_daily_reports,
+            "date": dt_reports.dt.strftime("%Y-%m-%d").to_list(),
+            "url": new_links,
             "url_perc": links_perc_encoded,
             # "valid_url_perc" : valid_url
-        }
+        },
+        index=range(first_index, first_index + len(new_links)),
     )
 
+    # Append to catalog, in date order
+    df_url_reports = pd.concat([df_url_db, df_url_new], axis=0)
+    df_url_reports = df_url_reports.sort_values("date", kind="stable")
+
     # Print last date
-    df_url_reports = df_url_reports.sort_values("date")
     last_date_db = df_url_reports["date"].iloc[-1]
     print(f"Last entry in url db is from {last_date_db}")
 
     # Save as csv
     print("Saving url's dataframe...")
-    df_url_reports.to_csv("../data/database_url_reports.csv")
+    df_url_reports.to_csv(PATH_DB)
 
+    con = open_ledger()
+    ledger.record_discovered(con, zip(df_url_new["date"], df_url_new["url"]))
+    con.close()
 
-def download_reports():
-    """Downloading pdf of daily reports from PIO website"""
-
-    PATH_DB = "../data/database_url_reports.csv"
-    PATH_REPORTS = "../data/reports"
-
-    # Load local database
-    df_url = pd.read_csv(PATH_DB, index_col=[0])
-    # df_url["date"] = pd.to_datetime(df_url["date"], format="%Y-%m-%d")
 
-    # Missing reports in database
+def open_ledger():
+    """Ledger w state of each report, created from existing files on first use"""
+    con = ledger.connect()
+    if ledger.is_empty(con):
+        parsed_dates = []
+        if os.path.isfile(PATH_INFO_REPORTS):
+            parsed_dates = pd.read_csv(PATH_INFO_REPORTS, usecols=["date"])["date"]
+        ledger.bootstrap(con, load_url_catalog(PATH_DB), PATH_REPORTS, parsed_dates)
+    return con
 
-    # Get dates from url database
-    list_dates_url = df_url["date"].replace("-", "_", regex=True).to_list()
 
-    # Get dates from reports in data folder
-    list_dates_db = [path.split(".")[0] for path in os.listdir(PATH_REPORTS)]
+def download_reports():
+    """Downloading pdf of daily reports from PIO website"""
 
-    # Find difference between do - check only
-    missing_dates = list(set(list_dates_url) - set(list_dates_db))
-    # Get only from 16_07_2021, ie when vaccination percentage appeared in the reports
-    missing_dates = [d for d in missing_dates if d >= "2021_07_16"]
+    con = open_ledger()
+
+    # Corrupt/partial reports are removed, so they are downloaded again
+    stored_hashes = ledger.stored_hashes(con)
+    bad_reports, adopted = ut.verify_reports(PATH_REPORTS, stored_hashes)
+    ledger.record_downloaded(con, adopted)
+    if bad_reports:
+        print(f"Removing {len(bad_reports)} corrupt/partial reports:")
+        print(bad_reports)
+        for path in bad_reports:
+            os.remove(path)
+    dates_on_disk = {ut.report_date(p) for p in glob.glob(PATH_REPORTS + "/*.pdf")}
+    ledger.record_missing(con, set(stored_hashes) - dates_on_disk)
+
+    # Missing reports (only those for which there is a template, see extraction.TEMPLATES)
+    missing_dates = ledger.to_download(con)
     print("Missing reports...")
     print(missing_dates)
 
     ## Download missing reports
 
     # URls to download
-    missing_dates = [d.replace("_", "-") for d in missing_dates]
-    df_url_missing = df_url.query("date in @missing_dates")
-    # print(df_url_missing)
-
-    # Download missing reports
-    ut.download_pdfs(df_url_missing)
-
-
-def get_info_from_reports():
-    "Extract relevant info from pdf w daily reports"
-
-    PATH_INFO_REPORTS = "../data/data_from_pdf_reports.csv"
-    PATH_PDF_REPORTS = "../data/reports"
+    df_url = load_url_catalog(PATH_DB)
+    df_url_missing = df_url[df_url["date"].isin(missing_dates)].drop_duplicates(
+        "date", keep="last"
+    )
 
-    # Get dates from reports in data folder
-    paths_reports = glob.glob(PATH_PDF_REPORTS + "/*.pdf")
-    list_dates_reports = [path.split(".")[0] for path in os.listdir(PATH_PDF_REPORTS)]
+    # Download missing reports (concurrently, reusing connections to pio.gov.cy)
+    results = ut.download_pdfs(df_url_missing)
+    ledger.record_downloaded(
+        con,
+        [
+            (ut.report_date(r["path"]), r["sha256"], r["size"])
+            for r in results
+            if r["ok"]
+        ],
+    )
+    failed = {
+        ut.report_date(r["path"]): r["error"] or f"HTTP {r['status']}"
+        for r in results
+        if not r["ok"]
+    }
+    ledger.record_failed(con, failed, stage="download")
+    if failed:
+        print(f"Failed to download {len(failed)} reports:")
+        print(failed)
+    con.close()
+
+
+def get_info_from_reports(reextract_all=False):
+    """Extract relevant info from pdf w daily reports
+
+    Reports to parse come from the ledger: downloaded ones not parsed yet, and those parsed
+    by an older version of their template. Records are appended to the csv in small
+    batches (and marked parsed in the ledger), so an interrupted run resumes where it stopped.
+
+    :param reextract_all: extract info again from all reports (e.g. after fixing a regex),
+        instead of only from the new ones. Fast, as the text of the reports is cached.
+    """
 
-    # Load stored df with info from reports (if any)
-    if os.path.isfile(PATH_INFO_REPORTS):
-        df_hosp_unv = pd.read_csv(glob.glob(PATH_INFO_REPORTS)[0], index_col=[0])
-        last_date_db = df_hosp_unv["date"].iloc[-1]
-        print(f"Last day in stored data is : {last_date_db}")
-        # Get dates from df
-        list_dates_df = df_hosp_unv["date"].replace("-", "_", regex=True).to_list()
+    con = open_ledger()
+    if reextract_all:
+        ledger.reset_parsed(con)
 
-    # Find difference between the two
-    # -- note: get only from 16_07_2021, ie when vaccination % appeared in the reports
-    missing_dates = list(set(list_dates_reports) - set(list_dates_df))
-    missing_dates = [d for d in missing_dates if d >= "2021_07_16"]
+    dates_to_parse = ledger.to_parse(con)
     print("Missing info from (existing) reports from: ")
-    print(missing_dates)
-
-    # Get info from pdfs
+    print(dates_to_parse)
     paths_reports_missing = [
-        path
-        for path in paths_reports
-        if any(missing_date in path for missing_date in missing_dates)
+        os.path.join(PATH_REPORTS, date.replace("-", "_") + ".pdf")
+        for date in dates_to_parse
     ]
     # # Exclude info from falsy PDF report for the 2022_01_18
     # paths_reports_missing = [
     #     path for path in paths_reports_missing if "2022_01_18" not in path
     # ]
 
-    # print(paths_reports_missing)
-    df_hosp_unv_extra = ut.extract_info_from_reports(paths_reports_missing)
-    # print(df_hosp_unv_extra)
-
-    # Append new info if there was an info datafame in data folder
-    if os.path.isfile(PATH_INFO_REPORTS):
-        df_hosp_upd = pd.concat([df_hosp_unv, df_hosp_unv_extra], axis=0)
+    # Parse & append to csv, batch by batch
+    print("Saving hospitalizations info from reposts as csv..")
+    failed = ut.ingest_reports(
+        paths_reports_missing,
+        PATH_INFO_REPORTS,
+        on_batch=lambda records: ledger.record_parsed(
+            con, [record["date"] for record in records]
+        ),
+    )
+    ledger.record_failed(con, failed, stage="parse")
+    con.close()
+
+    if not os.path.isfile(PATH_INFO_REPORTS):
+        print("No info from reports yet..")
+        return
+    dates_df = pd.read_csv(PATH_INFO_REPORTS, usecols=["date"])["date"]
+
+    # Reports parsed again replace their old rows (only then the csv is rewritten).
+    # The csv is where reports are appended, the parquet copy is what later stages load
+    df_hosp_upd = pd.read_csv(PATH_INFO_REPORTS, index_col=[0])
+    if dates_df.duplicated().any():
+        df_hosp_upd = df_hosp_upd.drop_duplicates("date", keep="last")
+        df_hosp_upd = df_hosp_upd.sort_values(by="date")
+        storage.save(df_hosp_upd, "data_from_pdf_reports", export_csv=True)
     else:
-        df_hosp_upd = df_hosp_unv_extra
-    # print(df_hosp_upd)
+        storage.save(df_hosp_upd, "data_from_pdf_reports", export_csv=False)
 
-    # Append missing info from PIO if not already in df
-    df_hosp_upd = ut.df_append_missing_from_PIO(df_hosp_upd)
-    df_hosp_upd = df_hosp_upd.sort_values(by="date")
-    # print(df_hosp_upd["date"].iloc[-1])
+    last_date = df_hosp_upd["date"].max()
+    print(f"Data available until: {last_date.replace('-', '_')}")
 
-    # Save as csv
-    last_date = df_hosp_upd["date"].iloc[-1].replace("-", "_")
-    print("Saving hospitalizations info from reposts as csv..")
-    print(f"Data available until: {last_date}")
-    df_hosp_upd.to_csv(PATH_INFO_REPORTS)
+
+# Links to the csv files in data.gov.cy
+SUM_STATS_MATCHER = ut.LinkMatcher(
+    [
+        "https://www.data.gov.cy/sites/default/files/CY%20Covid19%20Open%20Data%20-%20Extended%20-%20new"
+    ],
+    exclude=["http://oneclick.cartodb.com"],
+)
+VACC_DATA_MATCHER = ut.LinkMatcher(
+    [
+        "https://www.data.gov.cy/sites/default/files/CY%20Vaccination%20Data%20by%20Target%20Group"
+    ],
+    exclude=["http://oneclick.cartodb.com"],
+)
 
 
 def get_url_with_sum_stats():
     """Check for latest url in data.gov.cy with summary daily stats"""
     base_url = "https://www.data.gov.cy/dataset/%CE%B7%CE%BC%CE%B5%CF%81%CE%AE%CF%83%CE%B9%CE%B1-%CF%83%CF%84%CE%B1%CF%84%CE%B9%CF%83%CF%84%CE%B9%CE%BA%CE%AC-%CE%B4%CE%B9%CE%B1%CF%83%CF%80%CE%BF%CF%81%CE%AC%CF%82-%CF%84%CE%B7%CF%82-%CE%BD%CF%8C%CF%83%CE%BF%CF%85-covid-19-%CF%83%CF%84%CE%B7%CE%BD-%CE%BA%CF%8D%CF%80%CF%81%CE%BF"
     list_of_links = ut.find_files_from_url(base_url)
-    substrings_in_path = [
-        "https://www.data.gov.cy/sites/default/files/CY%20Covid19%20Open%20Data%20-%20Extended%20-%20new"
-    ]
-    not_in_path = ["http://oneclick.cartodb.com"]
-    url_sum_stats = [
-        link
-        for link in list_of_links
-        if any(substring in link for substring in substrings_in_path)
-        & any(substring not in link for substring in not_in_path)
-    ]
+    url_sum_stats = SUM_STATS_MATCHER.filter(list_of_links)
     return url_sum_stats[0]
 
 
@@ -175,12 +262,19 @@ def download_sum_stats():
 
     --> note: this is not updated daily so it may have a lag
     --> (in another script) I complement these data with data from scraped daily reports
+
+    Returns False if the source did not change since the last download (nothing saved)
     """
 
     # Data scraping
     url_data = get_url_with_sum_stats()
     print("Downloading dataset...")
-    df = pd.read_csv(url_data)
+    response = hc.fetch(url_data, commit=False)  # committed once saved
+    if not response.changed and storage.exists("dataset_sum_daily_stats"):
+        print("Summary dataset did not change since last download.")
+        hc.commit(url_data)  # same body as the saved dataset
+        return False
+    df = pd.read_csv(io.BytesIO(response.content))
     # Format DF
     df1 = df.copy()
     df1 = df1.replace(":", np.nan)
@@ -191,7 +285,10 @@ def download_sum_stats():
 
     # Save dataset
     print("Saving dataset...")
-    df1.to_csv("../data/dataset_sum_daily_stats.csv")
+    storage.save(df1, "dataset_sum_daily_stats")
+    hc.commit(url_data)
+
+    return True
 
 
 def get_url_with_vacc_data():
@@ -199,30 +296,32 @@ def get_url_with_vacc_data():
 
     base_url = "https://www.data.gov.cy/dataset/%CE%B5%CE%B2%CE%B4%CE%BF%CE%BC%CE%B1%CE%B4%CE%B9%CE%B1%CE%AF%CE%B1-%CF%83%CF%84%CE%B1%CF%84%CE%B9%CF%83%CF%84%CE%B9%CE%BA%CE%AC-%CE%B5%CE%BC%CE%B2%CE%BF%CE%BB%CE%B9%CE%B1%CF%83%CE%BC%CF%8E%CE%BD-%CE%BA%CE%B1%CF%84%CE%AC-%CF%84%CE%B7%CF%82-%CE%BD%CF%8C%CF%83%CE%BF%CF%85-covid-19-%CE%B1%CE%BD%CE%AC-%CE%BF%CE%BC%CE%AC%CE%B4%CE%B1-%CF%83%CF%84%CF%8C%CF%87%CE%BF"
     list_of_links = ut.find_files_from_url(base_url)
-    substrings_in_path = [
-        "https://www.data.gov.cy/sites/default/files/CY%20Vaccination%20Data%20by%20Target%20Group"
-    ]
-    not_in_path = ["http://oneclick.cartodb.com"]
-    url_vacc_stats = [
-        link
-        for link in list_of_links
-        if any(substring in link for substring in substrings_in_path)
-        & any(substring not in link for substring in not_in_path)
-    ]
+    url_vacc_stats = VACC_DATA_MATCHER.filter(list_of_links)
     return url_vacc_stats[0]
 
 
 def download_vaccination_data():
-    """Download dataset with vaccination per week, target group, vaccine, dose etc"""
+    """Download dataset with vaccination per week, target group, vaccine, dose etc
+
+    Returns False if the source did not change since the last download (nothing saved)
+    """
 
     # find the correct url
 
     total_population = 888_005
     print("Downloading vaccination dataset...")
     url_vaccination = get_url_with_vacc_data()
-    df_v1 = pd.read_csv(url_vaccination)
+    response = hc.fetch(url_vaccination, commit=False)  # committed once saved
+    if not response.changed and storage.exists("vaccination_dataset"):
+        print("Vaccination dataset did not change since last download.")
+        hc.commit(url_vaccination)  # same body as the saved dataset
+        return False
+    df_v1 = pd.read_csv(io.BytesIO(response.content))
     df_v1["Population"] = total_population
     last_week = df_v1["YearWeekISO"].iloc[-1]
     print(f"Vaccination data are available until {last_week}.")
     print("Saving vaccination dataset...")
-    df_v1.to_csv(f"../data/vaccination_dataset.csv")
+    storage.save(df_v1, "vaccination_dataset")
+    hc.commit(url_vaccination)
+
+    return True
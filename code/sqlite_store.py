@@ -0,0 +1,183 @@
+"""Optional sqlite store of the datasets (storage.USE_SQLITE)
+
+One table per dataset, keyed by date (by week, target group & vaccine for the
+vaccination data). Saving a dataset upserts only its new/changed rows and deletes
+the rows that are gone. Values keep their python type (no column affinity) and
+their row position in the csv, so the csv files can be regenerated byte for byte.
+"""
+
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+PATH_STORE = "../data/datasets.sqlite"
+
+# Dataset -> primary key columns
+KEYS = {
+    "dataset_sum_daily_stats": ["date"],
+    "data_from_pdf_reports": ["date"],
+    "dataset_extented": ["date"],
+    "dataset_extented_sources": ["date"],
+    "vaccination_dataset": ["YearWeekISO", "TargetGroup", "Vaccine"],
+}
+# Dataset -> indexes, besides the primary key
+INDEXES = {
+    "vaccination_dataset": [["TargetGroup", "YearWeekISO", "Vaccine"]],
+}
+ROW, INDEX = "_row", "_index"  # position & index (first column) of each row in the csv
+
+
+def connect(path_store=PATH_STORE):
+    return sqlite3.connect(path_store)
+
+
+def _quote(column):
+    return '"' + column.replace('"', '""') + '"'
+
+
+def table_columns(con, name):
+    """Dataset columns of the table (w/o ROW & INDEX), [] if there is no table"""
+    rows = con.execute(f"PRAGMA table_info({_quote(name)})").fetchall()
+    return [row[1] for row in rows if row[1] not in (ROW, INDEX)]
+
+
+def create_table(con, name, columns):
+    """(Re)create the table of dataset `name` w these columns"""
+    definitions = ", ".join(_quote(column) for column in [ROW, INDEX] + columns)
+    key = ", ".join(map(_quote, KEYS[name]))
+    with con:
+        con.execute(f"DROP TABLE IF EXISTS {_quote(name)}")
+        con.execute(f"CREATE TABLE {_quote(name)} ({definitions}, PRIMARY KEY ({key}))")
+        for i, index_columns in enumerate(INDEXES.get(name, [])):
+            con.execute(
+                f"CREATE INDEX {_quote(f'{name}_{i}')} ON {_quote(name)} "
+                f"({', '.join(map(_quote, index_columns))})"
+            )
+
+
+def _python_value(value):
+    """numpy/pandas value -> value sqlite stores as is (dates as "YYYY-MM-DD")"""
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return None
+    if value is pd.NaT or value is pd.NA:
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def _rows(df):
+    """Rows (ROW, INDEX, *columns) w python values"""
+    values = df.astype(object).to_numpy()
+    return [
+        tuple([row, _python_value(index)] + [_python_value(v) for v in values[row]])
+        for row, index in enumerate(df.index)
+    ]
+
+
+def upsert(con, name, df):
+    """Save df as dataset `name`, writing only rows that are new or changed
+
+    The rows of df go to a temp table, compared w the stored ones by key inside
+    sqlite (the stored table is never read into python).
+    Returns (number of rows written, number of rows deleted)
+    """
+    columns = [str(column) for column in df.columns]
+    if table_columns(con, name) != columns:
+        create_table(con, name, columns)
+
+    all_columns = [ROW, INDEX] + columns
+    names = ", ".join(map(_quote, all_columns))
+    keys = [_quote(column) for column in KEYS[name]]
+    table, incoming = _quote(name), "temp._incoming"
+    same_key = " AND ".join(f"s.{key} = i.{key}" for key in keys)
+    # 24 and 24.0 (or "24") are written differently in the csv -> they differ here too
+    same_values = " AND ".join(
+        f"typeof(s.{c}) = typeof(i.{c}) AND s.{c} IS i.{c}"
+        for c in map(_quote, all_columns)
+    )
+    changed = f"NOT EXISTS (SELECT 1 FROM {table} s WHERE {same_key} AND {same_values})"
+    updates = ", ".join(
+        f"{_quote(column)} = excluded.{_quote(column)}"
+        for column in all_columns
+        if column not in KEYS[name]
+    )
+
+    with con:
+        con.execute(f"DROP TABLE IF EXISTS {incoming}")
+        con.execute(f"CREATE TEMP TABLE _incoming ({names})")
+        con.execute(f"CREATE INDEX temp._incoming_key ON _incoming ({', '.join(keys)})")
+        con.executemany(
+            f"INSERT INTO {incoming} VALUES ({', '.join('?' * len(all_columns))})",
+            _rows(df),
+        )
+        n_deleted = con.execute(
+            f"DELETE FROM {table} WHERE NOT EXISTS "
+            f"(SELECT 1 FROM {incoming} i WHERE "
+            + " AND ".join(f"{table}.{key} = i.{key}" for key in keys)
+            + ")"
+        ).rowcount
+        n_written = con.execute(
+            f"SELECT COUNT(*) FROM {incoming} i WHERE {changed}"
+        ).fetchone()[0]
+        con.execute(
+            f"INSERT INTO {table} ({names}) SELECT {names} FROM {incoming} i "
+            f"WHERE {changed} ON CONFLICT ({', '.join(keys)}) DO UPDATE SET {updates}"
+        )
+        con.execute(f"DROP TABLE {incoming}")
+    return n_written, n_deleted
+
+
+def load(con, name, columns=None, first_date=None, last_date=None, where=None):
+    """Rows of dataset `name` in csv order (dates as "YYYY-MM-DD" strings)
+
+    :param first_date, last_date: only rows in this date range (inclusive, indexed)
+    :param where: {column: [values]}, e.g. {"TargetGroup": ["Age18_24"]}
+    """
+    columns = table_columns(con, name) if columns is None else list(columns)
+    conditions, params = [], []
+    if first_date is not None:
+        conditions.append('"date" >= ?')
+        params.append(str(pd.Timestamp(first_date).date()))
+    if last_date is not None:
+        conditions.append('"date" <= ?')
+        params.append(str(pd.Timestamp(last_date).date()))
+    for column, values in (where or {}).items():
+        conditions.append(f"{_quote(column)} IN ({', '.join('?' * len(values))})")
+        params.extend(values)
+    sql = f"SELECT {', '.join(map(_quote, [INDEX] + columns))} FROM {_quote(name)}"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    rows = con.execute(sql + f" ORDER BY {ROW}", params).fetchall()
+
+    # object columns -> each value is written to the csv as it was stored
+    df = pd.DataFrame(rows, columns=[INDEX] + columns, dtype=object)
+    df = df.where(df.notna(), np.nan)  # None -> NaN, as in frames read from csv
+    return df.set_index(INDEX).rename_axis(None)
+
+
+def export_csv(con, name, path_csv):
+    """Write the csv of dataset `name` from the store (same bytes as the saved one)"""
+    df = load(con, name)
+    df.to_csv(path_csv + ".tmp")
+    os.replace(path_csv + ".tmp", path_csv)
+
+
+def has_dataset(con, name):
+    return bool(table_columns(con, name))
+
+
+if __name__ == "__main__":
+    # Regenerate the csv files of all datasets in the store
+    con = connect()
+    for name in KEYS:
+        if has_dataset(con, name):
+            export_csv(
+                con, name, os.path.join(os.path.dirname(PATH_STORE), name + ".csv")
+            )
+            print(f"Exported {name}")
+    con.close()
@@ -0,0 +1,192 @@
+"""Storage of the datasets passed between the stages (scraping -> merging -> plots)
+
+Datasets are saved as parquet (pyarrow) w dates stored natively, so loading them
+doesn't parse text & dates again, and can read only the columns needed.
+The csv files in data/ remain an optional export (EXPORT_CSV) for the public repo.
+W/o pyarrow installed, datasets are only saved & loaded as csv.
+
+W USE_SQLITE the datasets are kept in one sqlite file instead (see sqlite_store),
+where saving writes only new/changed rows & the csv files are regenerated from it.
+"""
+
+import os
+
+import pandas as pd
+
+import schema
+import sqlite_store
+
+try:
+    import pyarrow
+except ImportError:
+    pyarrow = None
+
+DATA_DIR = "../data"
+EXPORT_CSV = True  # also write the csv of every dataset saved
+USE_SQLITE = False  # datasets in data/datasets.sqlite instead of parquet files
+# Datasets (file names w/o extension) are the ones in schema.SCHEMAS
+
+
+def path_csv(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, name + ".csv")
+
+
+def path_parquet(name, data_dir=DATA_DIR):
+    return os.path.join(data_dir, name + ".parquet")
+
+
+def _parquet_is_current(name, data_dir):
+    """Parquet file exists & is not older than the csv (csv may be edited/pulled)"""
+    if pyarrow is None or not os.path.isfile(path_parquet(name, data_dir)):
+        return False
+    csv = path_csv(name, data_dir)
+    return not os.path.isfile(csv) or os.path.getmtime(
+        path_parquet(name, data_dir)
+    ) >= os.path.getmtime(csv)
+
+
+def path_sqlite(data_dir=DATA_DIR):
+    return os.path.join(data_dir, os.path.basename(sqlite_store.PATH_STORE))
+
+
+def exists(name, data_dir=DATA_DIR):
+    if USE_SQLITE and os.path.isfile(path_sqlite(data_dir)):
+        con = sqlite_store.connect(path_sqlite(data_dir))
+        found = sqlite_store.has_dataset(con, name)
+        con.close()
+        if found:
+            return True
+    return os.path.isfile(path_parquet(name, data_dir)) or os.path.isfile(
+        path_csv(name, data_dir)
+    )
+
+
+def _parse_dates(df, name):
+    for column in schema.date_columns(name):
+        if column in df.columns and not pd.api.types.is_datetime64_any_dtype(
+            df[column]
+        ):
+            df[column] = pd.to_datetime(df[column], format="%Y-%m-%d")
+    return df
+
+
+def _numeric_columns(df, name):
+    """Text columns w only numbers (e.g. "24" after replacing ":") as numbers,
+    the same types reading the csv back gives"""
+    df = df.copy()
+    for column in df.columns:
+        if pd.api.types.is_numeric_dtype(df[column]) or column in schema.date_columns(
+            name
+        ):
+            continue
+        numbers = pd.to_numeric(df[column], errors="coerce")
+        if numbers.notna().sum() == df[column].notna().sum():
+            df[column] = numbers
+    return df
+
+
+def save(df, name, export_csv=EXPORT_CSV, data_dir=DATA_DIR):
+    """Save dataset `name` (parquet and/or csv), each file replaced atomically"""
+    df = _parse_dates(df.copy(), name)
+    if USE_SQLITE:
+        con = sqlite_store.connect(path_sqlite(data_dir))
+        n_written, n_deleted = sqlite_store.upsert(con, name, df)
+        print(f"{name}: {n_written} rows written, {n_deleted} deleted")
+        if export_csv:
+            sqlite_store.export_csv(con, name, path_csv(name, data_dir))
+        con.close()
+        return
+    if pyarrow is not None:
+        path = path_parquet(name, data_dir)
+        _numeric_columns(df, name).to_parquet(path + ".tmp", engine="pyarrow")
+        os.replace(path + ".tmp", path)
+    if export_csv or pyarrow is None:
+        path = path_csv(name, data_dir)
+        df.to_csv(path + ".tmp")
+        os.replace(path + ".tmp", path)
+        if pyarrow is not None:
+            # csv written last -> keep the parquet file as the current one
+            os.utime(path_parquet(name, data_dir))
+
+
+def _date_range(df, first_date, last_date):
+    if first_date is None and last_date is None:
+        return df
+    dates = df["date"]
+    mask = pd.Series(True, index=df.index)
+    if first_date is not None:
+        mask &= dates >= pd.Timestamp(first_date)
+    if last_date is not None:
+        mask &= dates <= pd.Timestamp(last_date)
+    return df[mask]
+
+
+def _load_sqlite(name, columns, first_date, last_date, data_dir):
+    """Dataset from the sqlite store (None if it's not there)"""
+    if not os.path.isfile(path_sqlite(data_dir)):
+        return None
+    con = sqlite_store.connect(path_sqlite(data_dir))
+    df = None
+    if sqlite_store.has_dataset(con, name):
+        df = sqlite_store.load(con, name, columns, first_date, last_date)
+        df = _parse_dates(_numeric_columns(df, name), name)
+    con.close()
+    return df
+
+
+def load(
+    name,
+    columns=None,
+    compact=False,
+    first_date=None,
+    last_date=None,
+    data_dir=DATA_DIR,
+):
+    """Load dataset `name` w dates parsed (only `columns` if given)
+
+    :param compact: use the compact dtypes of schema.SCHEMAS, w/o the index column
+        -> frames ~2x smaller to hold, but loading is slower (the dtype conversion,
+        ~3x on the current csv files) & peak memory while loading is the same
+    :param first_date, last_date: only rows in this date range (inclusive),
+        an indexed range query w USE_SQLITE
+    """
+    if USE_SQLITE:
+        df = _load_sqlite(name, columns, first_date, last_date, data_dir)
+        if df is not None:
+            if compact:
+                df = df.astype(schema.compact_dtypes(name, df.columns))
+                df = df.reset_index(drop=True)
+            return df
+
+    filter_dates = first_date is not None or last_date is not None
+    if columns is not None and filter_dates and "date" not in columns:
+        columns = list(columns) + ["date"]  # needed to select the date range
+    if _parquet_is_current(name, data_dir):
+        df = pd.read_parquet(
+            path_parquet(name, data_dir), columns=columns, engine="pyarrow"
+        )
+        if compact:
+            df = df.astype(schema.compact_dtypes(name, df.columns))
+            df = df.reset_index(drop=True)
+        return _date_range(df, first_date, last_date)
+
+    if compact:
+        # the index column is not read at all
+        if columns is None:
+            usecols = lambda column: column != "Unnamed: 0"
+        else:
+            usecols = lambda column: column in columns
+        df = pd.read_csv(
+            path_csv(name, data_dir),
+            usecols=usecols,
+            dtype=schema.compact_dtypes(name, columns),
+        )
+        return _date_range(_parse_dates(df, name), first_date, last_date)
+
+    usecols = None
+    if columns is not None:
+        keep = set(columns) | {"Unnamed: 0"}  # + the index column
+        usecols = lambda column: column in keep
+    df = pd.read_csv(path_csv(name, data_dir), index_col=[0], usecols=usecols)
+    df.index.name = None
+    return _date_range(_parse_dates(df, name), first_date, last_date)
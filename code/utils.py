@@ -1,34 +1,123 @@
-from bs4 import BeautifulSoup
 from datetime import datetime
+from html.parser import HTMLParser
 import urllib
-import requests
 import pandas as pd
 import string
 from dateutil.parser import parse
 
 
-import io
-from pdfminer.pdfinterp import PDFResourceManager
+import json
 from pdfminer.layout import LAParams
-from pdfminer.converter import TextConverter
-from pdfminer.pdfinterp import PDFPageInterpreter
-from pdfminer.pdfpage import PDFPage
 import re
+import os
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+import downloader as dl
+import extraction as ex
+import http_cache as hc
+import pdf_backends as pb
+
+
+class HrefCollector(HTMLParser):
+    """Collects href of <a> tags while the html is parsed, no tree is built"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.hrefs = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href" and value is not None:
+                    self.hrefs.append(value)
+                    break
+
+
+class _LxmlHrefTarget:
+    """Parser target for lxml, gets start/end events only (no tree is built)"""
+
+    def __init__(self):
+        self.hrefs = []
+
+    def start(self, tag, attrib):
+        if tag == "a":
+            href = attrib.get("href")
+            if href is not None:
+                self.hrefs.append(href)
+
+    def end(self, tag):
+        pass
+
+    def data(self, data):
+        pass
+
+    def close(self):
+        return self.hrefs
+
+
+def extract_hrefs(html, use_lxml=True):
+    """Returns href of all <a> tags in html (anchors without href are skipped)"""
+    if use_lxml and lxml_etree is not None:
+        parser = lxml_etree.HTMLParser(target=_LxmlHrefTarget(), encoding="utf-8")
+        return lxml_etree.fromstring(html.encode("utf-8"), parser)
+
+    collector = HrefCollector()
+    collector.feed(html)
+    collector.close()
+    return collector.hrefs
 
 
 def find_files_from_url(url):
     """Find links to files in a website"""
-    soup = BeautifulSoup(requests.get(url).text, features="html.parser")
-    hrefs = []
-    for a in soup.find_all("a"):
-        hrefs.append(a["href"])
+    html, _ = hc.fetch_text(url)
+    hrefs = extract_hrefs(html)
 
     return hrefs
 
 
-# Isolate only those urls corresponding to daily reports
-def isolate_relevant_files(list_of_links):
-    substrings_in_path = [
+class LinkMatcher:
+    """Matches links against many substrings at once (one compiled alternation regex)
+
+    :param include: substrings, a link is kept if it contains any of them
+    :param exclude: substrings, a link is dropped if it contains any of them
+    """
+
+    def __init__(self, include, exclude=()):
+        self.include = list(include)
+        self.exclude = list(exclude)
+        self._include_re = self._compile(self.include)
+        self._exclude_re = self._compile(self.exclude) if self.exclude else None
+
+    @staticmethod
+    def _compile(substrings):
+        # longest first, so that a pattern contained in another one doesn't shadow it
+        alternatives = sorted(set(substrings), key=len, reverse=True)
+        return re.compile("|".join(re.escape(s) for s in alternatives))
+
+    def match(self, link):
+        """Returns the (first) substring found in link, None if no match or excluded"""
+        if self._exclude_re is not None and self._exclude_re.search(link):
+            return None
+        m = self._include_re.search(link)
+        return m.group(0) if m else None
+
+    def filter(self, links):
+        """Returns only the matching links (keeps their order)"""
+        include = self._include_re.search
+        if self._exclude_re is None:
+            return [link for link in links if include(link)]
+        exclude = self._exclude_re.search
+        return [link for link in links if include(link) and not exclude(link)]
+
+
+REPORT_LINK_MATCHER = LinkMatcher(
+    [
         "Ανακοίνωση του Υπουργείου Υγείας σχετικά με νέα περιστατικά της νόσου COVID-19",
         "Ανακοίνωση του Υπουργείου Υγείας για νέα περιστατικά της νόσου COVID-19",
         "Ανακοίνωση για επιβεβαίωση κρουσμάτων κορωνοϊού",
@@ -37,11 +126,12 @@ def isolate_relevant_files(list_of_links):
         "krousmataEL",
         "Krousmata",
     ]
-    links_daily_reports = [
-        link
-        for link in list_of_links
-        if any(substring in link for substring in substrings_in_path)
-    ]
+)
+
+
+# Isolate only those urls corresponding to daily reports
+def isolate_relevant_files(list_of_links):
+    links_daily_reports = REPORT_LINK_MATCHER.filter(list_of_links)
 
     return links_daily_reports
 
@@ -122,6 +212,93 @@ def extract_datetime(link):
     return dt_report
 
 
+# Same patterns strptime uses for "%d%m%Y" and "%d %m %Y"
+RE_DATE_DDMMYYYY = re.compile(
+    r"^(3[01]|[12]\d|0[1-9]|[1-9])(1[0-2]|0[1-9]|[1-9])(\d{4})$"
+)
+RE_DATE_D_M_YYYY = re.compile(
+    r"^(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])\s+(1[0-2]|0[1-9]|[1-9])\s+(\d{4})$"
+)
+RE_MONTH_GR = re.compile("|".join(map_month.keys()))
+PUNCTUATION_PLUS_TABLE = str.maketrans("", "", string.punctuation + "–")
+
+# link -> datetime, for links already seen by extract_datetimes
+_datetime_of_link = {}
+
+
+def _dates_from_parts(parts):
+    """DataFrame w day, month, year string columns (NaN if no match) -> datetime64 Series"""
+    return pd.to_datetime(
+        pd.DataFrame(
+            {
+                "year": pd.to_numeric(parts[2]),
+                "month": pd.to_numeric(parts[1]),
+                "day": pd.to_numeric(parts[0]),
+            }
+        ),
+        errors="coerce",
+    )
+
+
+def extract_datetimes(links):
+    """Same as extract_datetime, but for a whole Series of links at once
+
+    Returns Series of datetime64 with the same index as links.
+    Raises ValueError if a date can't be extracted from some links.
+    """
+    links = pd.Series(links)
+    new_links = pd.Series(
+        [link for link in links.unique() if link not in _datetime_of_link],
+        dtype=object,
+    )
+
+    if not new_links.empty:
+        dates = pd.Series(pd.NaT, index=new_links.index, dtype="datetime64[ns]")
+
+        # 1. Date given after "uploads/" in link (DDMMYYYY before "--", "_" or "-")
+        after_uploads = new_links.str.split("uploads/", n=1).str[1]
+        for string_joint in ["--", "_", "-"]:
+            missing = dates.isna()
+            if not missing.any():
+                break
+            candidate = (
+                after_uploads[missing]
+                .str.split(string_joint, n=1)
+                .str[0]
+                .str.replace(" ", "", regex=False)
+            )
+            parts = candidate.str.extract(RE_DATE_DDMMYYYY)
+            dates[missing] = _dates_from_parts(parts)
+
+        # 2. Date given (in greek) before .pdf, e.g. "... COVID-19 – 5 Δεκεμβρίου 2021.pdf"
+        missing = dates.isna()
+        if missing.any():
+            date_str_gr = (
+                new_links[missing]
+                .str.split("COVID-19", n=1)
+                .str[1]
+                .str.split(".", n=1)
+                .str[0]
+                .str.translate(PUNCTUATION_PLUS_TABLE)
+                .str.replace(
+                    RE_MONTH_GR, lambda m: str(map_month[m.group(0)]), n=1, regex=True
+                )
+                .str.lstrip()
+            )
+            no_year = ~date_str_gr.str.contains("2021|2022", na=True)
+            date_str_gr[no_year] = date_str_gr[no_year] + " 2022"
+            parts = date_str_gr.str.extract(RE_DATE_D_M_YYYY)
+            dates[missing] = _dates_from_parts(parts)
+
+        if dates.isna().any():
+            raise ValueError(
+                f"Could not extract date from: {new_links[dates.isna()].tolist()}"
+            )
+        _datetime_of_link.update(zip(new_links, dates))
+
+    return links.map(_datetime_of_link).astype("datetime64[ns]")
+
+
 def percent_encode_url(url):
     """encode utf-8 greek charachters to percent-encoded"""
     url_percent_encoded = (
@@ -132,214 +309,304 @@ def percent_encode_url(url):
     return url_percent_encoded
 
 
-def download_pdfs(df_url):
+def download_pdfs(df_url, max_in_flight=dl.MAX_IN_FLIGHT):
     """Downloading pdf daily reports from url's in a df"""
     if df_url.empty:
         print("No new reports. Nothing to download.")
+        return []
 
-    for _, row in df_url.iterrows():
-        date_str = row["date"]
-        print(f"Downloading report (pdf) of {date_str}...")
-        filename_report = row["date"].replace("-", "_")
-        path_report = "../data/reports/" + filename_report + ".pdf"
-        # print(url_percent_encoded)
-
-        # download and save report as pdf
-        response = requests.get(row["url_perc"])
-        with open(path_report, "wb") as f:
-            f.write(response.content)
-        print(f"Valid url: {response.ok}")
-
-        response.close()
-
-
-map_numbers = {
-    "Ένα": "1",
-    "Δύο": "2",
-    "Τρία": "3",
-    "Τέσσερα": "4",
-    "Πέντε": "5",
-    "Έξι": "6",
-    "Επτά": "7",
-    "Εφτά": "7",
-    "Οχτώ": "8",
-    "Εννιά": "9",
-    "Δέκα": "10",
-    "Έντεκα": "11",
-    "Δώδεκα": "12",
-    "Δεκατρία": "13",
-}
+    # (url, path) for each report
+    jobs = [
+        (row["url_perc"], "../data/reports/" + row["date"].replace("-", "_") + ".pdf")
+        for _, row in df_url.iterrows()
+    ]
+    print(f"Downloading {len(jobs)} reports (pdf), {max_in_flight} at a time...")
+
+    # download and save reports as pdf
+    results = dl.download_many(jobs, max_in_flight=max_in_flight)
+
+    return results
+
+
+def file_sha256(path, chunk_size=dl.CHUNK_SIZE):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
 
 
-def pdf_to_text(path):
-    with open(path, "rb") as fp:
-        rsrcmgr = PDFResourceManager()
-        outfp = io.StringIO()
-        laparams = LAParams()
-        device = TextConverter(rsrcmgr, outfp, laparams=laparams)
-        interpreter = PDFPageInterpreter(rsrcmgr, device)
-        for page in PDFPage.get_pages(fp):
-            interpreter.process_page(page)
-    text = outfp.getvalue()
+def has_pdf_trailer(path):
+    """Cheap check for truncated pdf: complete files end with %%EOF (plus some whitespace)"""
+    with open(path, "rb") as f:
+        f.seek(0, os.SEEK_END)
+        f.seek(max(0, f.tell() - 1024))
+        return b"%%EOF" in f.read()
+
+
+def verify_reports(path_reports, stored_hashes):
+    """Find corrupt/partial reports (w/o parsing them)
+
+    Reports with a stored hash ({date: (sha256, size)}) are checked against it. Reports
+    without (e.g. downloaded before hashes were stored) are checked for the pdf trailer.
+    Returns (paths of bad reports, [(date, sha256, size)] of good reports w/o stored hash)
+    (a missing path_reports -> no reports)
+    """
+    bad_reports = []
+    adopted = []
+    if not os.path.isdir(path_reports):
+        return bad_reports, adopted
+    for filename in sorted(os.listdir(path_reports)):
+        if not filename.endswith(".pdf") or filename.startswith("."):
+            continue
+        path = os.path.join(path_reports, filename)
+        date = report_date(path)
+        if date in stored_hashes:
+            sha256, size = stored_hashes[date]
+            if os.path.getsize(path) != size or file_sha256(path) != sha256:
+                bad_reports.append(path)
+        elif has_pdf_trailer(path):
+            adopted.append((date, file_sha256(path), os.path.getsize(path)))
+        else:
+            bad_reports.append(path)
+
+    return bad_reports, adopted
+
+
+def normalize_report_text(text):
+    """Strip newlines, nbsp & parentheses, as expected by the extraction patterns"""
+    return text.replace("\n", "").replace("\xa0", "").replace("(", "").replace(")", "")
+
+
+def report_complete_check(path_report):
+    """Function text -> whether the report has been parsed far enough, from the
+    template of its date (None -> parse all pages)"""
+    template = ex.template_for(report_date(path_report))
+    return None if template is None else template.complete
+
+
+def pdf_to_text(path, maxpages=0, stop_when_complete=None, backend=None):
+    """Text of pdf, page by page
+
+    :param maxpages: parse at most this many pages (0 -> all)
+    :param stop_when_complete: function (normalized) text -> bool, e.g. from
+        report_complete_check, stop after the first page by which it is True
+    :param backend: name of backend in pdf_backends.BACKENDS (None -> the calibrated one)
+    """
+    pages = pb.BACKENDS[backend or pb.selected_backend()](path, maxpages)
+    text = ""
+    for page_text in pages:
+        text += page_text
+        if stop_when_complete is not None and stop_when_complete(
+            normalize_report_text(text)
+        ):
+            break
+    pages.close()
 
     return text
 
 
-def number_key_in_string(date_string):
-    numbers_list = [
-        number if number in date_string else None for number in map_numbers.keys()
-    ]  # None except on matching month
-    number_key = list(filter(None, numbers_list))  # remove None
-
-    return number_key[0]
-
-
-def extract_info_text(text):
-    m1 = re.search("Ποσοστό (\s*.+?)%", text)  # "\s*" ignores white space
-    perc_unv = m1.group(1) if m1 else None
-    if not m1.group(1).strip().isnumeric():
-        m1a = re.search("στορικό εμβολιασμού(.+?)%", text)
-        perc_str = re.findall(r"[-+]?(?:\d*\.\d+|\d+)", m1a.group(1).replace(",", "."))
-        perc_unv = perc_str[0]
-
-    m2 = re.search("σήμερα, (.+?):", text)
-    date_pdf = m2.group(1) if m2 else None
-
-    m3 = re.search("(\w+?) ασθενείς COVID-19 νοσηλεύονται", text)
-    hosp_num = m3.group(1) if m3 else None
-
-    # m4 = re.search("ανίχνευσης αντιγόνου \(antigen rapid test\). -  (.+?) \(ποσοστό θετικότητας", text)
-    # case_num = m4.group(1) if m4 else None
-
-    m4 = re.search("test\.(.+?) ποσοστό", text)
-    m4a = re.search("Εντοπίστηκαν(\s*.+?\s*)νέα", text)
-    case_num = m4.group(1) if m4 else m4a.group(1) if m4a else None
-    if case_num is not None:
-        case_num = "".join(e for e in case_num if e.isalnum())  # keep only numbers
-        # case_num = case_num.split("-")[1].strip()
-
-    m5 = re.search("- (.+?) άτομ", text)
-    m5a = re.search("νακοινώθηκαν (.*) θάνατ", text)
-    m5b = re.search("νακοινώθηκε (.*) θάνατ", text)
-    m5c = re.search("- (.+?) θάνατ", text)
-    death_num = (
-        m5.group(1)
-        if m5
-        else m5a.group(1)
-        if m5a
-        else m5b.group(1)
-        if m5b
-        else m5c.group(1)
-        if m5c
-        else "0"
+# Reports are parsed until all needed fields are found, but never beyond this page (0 -> no limit)
+REPORT_MAXPAGES = 0
+
+
+TEXT_CACHE_DIR = "../data/text_cache"
+
+
+def text_settings_key(path_report):
+    """Short hash of everything that changes the text we get out of a pdf report
+    (w the complete function of its template only, see report_complete_check)"""
+    backend = pb.selected_backend()
+    template = ex.template_for(report_date(path_report))
+    complete = None
+    if template is not None and template.complete is not None:
+        complete = [template.complete.__name__, template.complete_version]
+    settings = {
+        "backend": [backend, pb.backend_version(backend)],
+        "laparams": vars(LAParams()),
+        "maxpages": REPORT_MAXPAGES,
+        "stop_when_complete": complete,
+    }
+    settings_json = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(settings_json.encode("utf-8")).hexdigest()[:12]
+
+
+def report_text(path_report, cache_dir=TEXT_CACHE_DIR):
+    """Normalized text of a pdf report, cached by pdf content hash & parsing settings
+
+    Only the first time a (report, settings) pair is seen the pdf is parsed.
+    """
+    cache_path = os.path.join(
+        cache_dir, f"{file_sha256(path_report)}_{text_settings_key(path_report)}.txt"
     )
+    if os.path.isfile(cache_path):
+        with open(cache_path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    text = pdf_to_text(
+        path_report,
+        maxpages=REPORT_MAXPAGES,
+        stop_when_complete=report_complete_check(path_report),
+    )
+    text = normalize_report_text(text)
 
-    if any(
-        substring in death_num
-        for substring in ["Δεν  καταγράφηκαν", "Δεν ανακοινώθηκαν"]
-    ):
-        death_num = "0"
+    os.makedirs(cache_dir, exist_ok=True)
+    with open(cache_path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(cache_path + ".tmp", cache_path)
 
-    if death_num != "0":
-        if not death_num.strip().isnumeric():
-            word_key = number_key_in_string(death_num)
-            death_num = map_numbers[word_key]
-    # print(f"Deaths : {death_num}")
+    return text
 
-    info = [perc_unv, date_pdf, hosp_num, case_num, death_num]
 
-    return info
+def report_date(path_report):
+    """'../data/reports/2021_07_16.pdf' -> '2021-07-16'"""
+    return os.path.basename(path_report).split(".pdf")[0].replace("_", "-")
 
 
-def extract_info_from_reports(list_path_reports):
-    """Returns Dataframe with relevant covid info, extracted from pdf daily reports"""
+def _count(value):
+    # fields a template doesn't require may be None
+    return "-" if value is None else f"{value:.0f}"
 
-    dates_url = []
-    percs_unv = []
-    dates_pdf = []
-    hosps_num = []
-    cases_num = []
-    deaths_num = []
 
-    for report in list_path_reports:
-        date_url = report.split("reports/")[1].split(".pdf")[0].replace("_", "-")
-        print(date_url)
-        dates_url.append(date_url)
-        text = pdf_to_text(report)
-        text = (
-            text.replace("\n", "").replace("\xa0", "").replace("(", "").replace(")", "")
-        )
+def info_from_report(path_report):
+    """Extract relevant covid info from one pdf report
 
-        info = extract_info_text(text)
-        percs_unv.append(info[0])
-        dates_pdf.append(info[1])
-        hosps_num.append(info[2])
-        cases_num.append(info[3])
-        deaths_num.append(info[4])
-
-        print(f"Date:{info[1]}({date_url}): {info[2]} hosp ({info[0]}% unvacc)")
-        print(f"{info[3]} new cases, {info[4]} deaths")
-
-    # Turn percentages to float
-    percs_unv1 = [float(perc.replace(",", ".")) for perc in percs_unv]
-    cases_num1 = [float(num.replace(",", "")) for num in cases_num]
-    # Put info in df
-    df_hosp_unv = pd.DataFrame(
-        {
-            "date": dates_url,
-            "hospitalizations_dailyrep": hosps_num,
-            "perc_hosp_unvaccinated": percs_unv1,
-            "daily new cases": cases_num1,
-            "daily deaths": deaths_num,
+    Returns (date, record dict, error). On failure record is None and error says why,
+    so that one bad report doesn't stop the others (this runs in worker processes).
+    """
+    date_url = report_date(path_report)
+    try:
+        template = ex.template_for(date_url)
+        if template is None:
+            raise ValueError("No report template for this date")
+        text = report_text(path_report)
+        info = template.extract(text)
+        missing = [field for field in template.required if getattr(info, field) is None]
+        if missing:
+            raise ValueError(f"Not found in report ({template.name}): {missing}")
+        perc_unv = info.perc_hosp_unvaccinated
+        record = {
+            "date": date_url,
+            "hospitalizations_dailyrep": info.hospitalizations,
+            "perc_hosp_unvaccinated": perc_unv,
+            "daily new cases": info.cases,
+            "daily deaths": info.deaths,
+            "perc_hosp_vaccinated": None if perc_unv is None else 100 - perc_unv,
         }
-    )
+        print(
+            f"Date:{info.date_pdf}({date_url}): {_count(info.hospitalizations)} hosp "
+            f"({info.perc_hosp_unvaccinated}% unvacc)"
+        )
+        print(f"{_count(info.cases)} new cases, {_count(info.deaths)} deaths")
+    except Exception as e:
+        return date_url, None, f"{type(e).__name__}: {e}"
+
+    return date_url, record, None
 
-    df_hosp_unv["perc_hosp_vaccinated"] = (
-        100 - df_hosp_unv["perc_hosp_unvaccinated"].values
-    )
-    # df_hosp_unv["date"] = pd.to_datetime(df_hosp_unv["date"], format="%Y-%m-%d")
-    df_hosp_unv["hospitalizations_dailyrep"] = df_hosp_unv[
-        "hospitalizations_dailyrep"
-    ].astype(float)
-    df_hosp_unv["daily deaths"] = df_hosp_unv["daily deaths"].astype(float)
-
-    return df_hosp_unv
-
-
-missing_reports_from_PIO = pd.DataFrame(
-    # "2022-03-22" : the pdf they provide is wrong document (https://bit.ly/3uiotot) -> get correct numbers from pio announcement : https://bit.ly/3JAPtG2
-    {
-        # "date": datetime.strptime("2021-12-05", "%Y-%m-%d"),
-        "date": ["2021-12-05", "2022-01-14", "2022-03-22"],
-        "hospitalizations_dailyrep": [119, 257, 151],
-        "perc_hosp_unvaccinated": [68.91, 73.16, 52.99],
-        "daily new cases": [307, 3042, 4673],
-        "daily deaths": [0, 0, 3],
-        "perc_hosp_vaccinated": [100 - 68.91, 100 - 73.16, 100 - 52.99],
-    },
-    index=[0, 1, 2],
-)
 
+REPORT_COLUMNS = [
+    "date",
+    "hospitalizations_dailyrep",
+    "perc_hosp_unvaccinated",
+    "daily new cases",
+    "daily deaths",
+    "perc_hosp_vaccinated",
+]
 
-def df_append_missing_from_PIO(df):
-    """If the miissng info from PIO are not already in the df -> adds them"""
 
-    # Add missing values
-    # 5.12.2022 -> the uploaded pdf for this day is the same as the one for the day before.
-    # Get actual data from :
-    # https://www.pio.gov.cy/%CE%B1%CE%BD%CE%B1%CE%BA%CE%BF%CE%B9%CE%BD%CF%89%CE%B8%CE%AD%CE%BD%CF%84%CE%B1-%CE%AC%CF%81%CE%B8%CF%81%CE%BF.html?id=24586#flat
+def iter_report_results(list_path_reports, workers=None, chunksize=4, window=64):
+    """Yields (date, record, error) of each report (see info_from_report), in date order
 
-    missing_dates_PIO = missing_reports_from_PIO["date"].tolist()
-    # print(missing_dates_PIO)
-    diff_dates = [d for d in missing_dates_PIO if d not in df["date"].tolist()]
-    # print(f"Difference : {diff_dates}")
-    df_extra = missing_reports_from_PIO.query("date in @diff_dates")
-    # print(f"Extra df : {df_extra}")
+    :param workers: number of processes parsing reports in parallel (None -> all cpus, 1 -> no pool)
+    :param chunksize: number of reports sent to a worker at a time
+    :param window: reports submitted to the pool at a time, bounds memory for long backlogs
+    """
+    list_path_reports = sorted(list_path_reports, key=report_date)
+    workers = workers or os.cpu_count() or 1
+    workers = min(workers, max(len(list_path_reports), 1))
+
+    if workers == 1:
+        for report in list_path_reports:
+            yield info_from_report(report)
+        return
+
+    print(f"Parsing {len(list_path_reports)} reports with {workers} processes...")
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for start in range(0, len(list_path_reports), window):
+            batch = list_path_reports[start : start + window]
+            yield from executor.map(info_from_report, batch, chunksize=chunksize)
+
+
+def iter_report_records(list_path_reports, failed_reports=None, **kwargs):
+    """Yields the record of each report that could be parsed, in date order
+
+    Failed reports are printed and, if a dict is given, added to failed_reports (date -> error).
+    """
+    for date, record, error in iter_report_results(list_path_reports, **kwargs):
+        if error is not None:
+            print(f"FAILED to extract info from report of {date}: {error}")
+            if failed_reports is not None:
+                failed_reports[date] = error
+            continue
+        yield record
+
+
+def repair_csv_tail(path_csv):
+    """Drop a partially written last line (e.g. after a crash while appending)"""
+    with open(path_csv, "rb+") as f:
+        content = f.read()
+        if content and not content.endswith(b"\n"):
+            f.truncate(content.rfind(b"\n") + 1)
+
+
+def next_csv_index(path_csv):
+    """Index for the next row appended to a csv saved w its index as first column"""
+    if not os.path.isfile(path_csv):
+        return 0
+    index = pd.read_csv(path_csv, usecols=[0]).iloc[:, 0]
+    return int(index.max()) + 1 if not index.empty else 0
+
+
+def append_records_csv(records, path_csv, first_index=None):
+    """Append records to csv (header written if the file is new), flushed to disk"""
+    if first_index is None:
+        first_index = next_csv_index(path_csv)
+    df = pd.DataFrame(
+        records,
+        columns=REPORT_COLUMNS,
+        index=range(first_index, first_index + len(records)),
+    )
+    write_header = not os.path.isfile(path_csv) or os.path.getsize(path_csv) == 0
+    with open(path_csv, "a", newline="") as f:
+        df.to_csv(f, header=write_header)
+        f.flush()
+        os.fsync(f.fileno())
 
-    if not df_extra.empty:
-        # need to add these to dataframe
-        df_hosp_extra = pd.concat([df, df_extra], axis=0)
-    else:
-        df_hosp_extra = df
 
-    return df_hosp_extra
+def ingest_reports(list_path_reports, path_csv, batch_size=10, on_batch=None, **kwargs):
+    """Parse reports & append their records to path_csv, in batches of batch_size
+
+    Each batch is on disk before the next one is parsed, so after a crash only the
+    current batch is lost. on_batch(records) is called after each batch is saved.
+    Returns dict date -> error of the reports that failed.
+    """
+    if os.path.isfile(path_csv):
+        repair_csv_tail(path_csv)
+    first_index = next_csv_index(path_csv)
+
+    failed_reports = {}
+    batch = []
+    for record in iter_report_records(list_path_reports, failed_reports, **kwargs):
+        batch.append(record)
+        if len(batch) == batch_size:
+            append_records_csv(batch, path_csv, first_index)
+            first_index += len(batch)
+            if on_batch is not None:
+                on_batch(batch)
+            batch = []
+    if batch:
+        append_records_csv(batch, path_csv, first_index)
+        if on_batch is not None:
+            on_batch(batch)
+
+    return failed_reports